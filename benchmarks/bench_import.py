@@ -0,0 +1,97 @@
+"""
+Startup cost of loading seedream_node, as ComfyUI does on every server start.
+
+    python benchmarks/bench_import.py
+    python benchmarks/bench_import.py --runs 10 --json
+
+Each run is a fresh interpreter: torch / numpy / PIL are imported first (ComfyUI has already
+loaded them by the time custom nodes are imported), then the node module is loaded and timed,
+then the deferred Ark SDK import is timed separately -- that cost moves to the first node
+execution. Exits with status 1 when loading the module pulls in any of the SDKs that are
+meant to load lazily, so it can be used as a regression check.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# 应在首次执行节点时才导入的模块
+DEFERRED_MODULES = ("volcenginesdkarkruntime", "tos", "requests", "wave")
+
+
+def run_child():
+    from bench_nodes import install_folder_paths_shim, load_node_module
+
+    start = time.perf_counter()
+    import numpy  # noqa: F401
+    import torch  # noqa: F401
+    from PIL import Image  # noqa: F401
+    preload_ms = (time.perf_counter() - start) * 1000
+
+    install_folder_paths_shim(tempfile.mkdtemp(prefix="seedream-import-"))
+    preloaded = {name for name in DEFERRED_MODULES if name in sys.modules}
+
+    start = time.perf_counter()
+    node_module = load_node_module()
+    module_ms = (time.perf_counter() - start) * 1000
+    eager = sorted(name for name in DEFERRED_MODULES if name in sys.modules and name not in preloaded)
+
+    start = time.perf_counter()
+    if hasattr(node_module, "_import_ark"):
+        node_module._import_ark()
+    else:  # 旧版本在模块顶层导入 SDK
+        import volcenginesdkarkruntime  # noqa: F401
+    ark_ms = (time.perf_counter() - start) * 1000
+
+    print(json.dumps({"preload_ms": preload_ms, "module_ms": module_ms, "ark_first_use_ms": ark_ms, "eager": eager}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    options = parser.parse_args()
+    if options.child:
+        return run_child()
+
+    runs = []
+    for _ in range(options.runs):
+        completed = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child"], stdout=subprocess.PIPE, text=True, check=True
+        )
+        runs.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+    summary = {
+        field: {
+            "median": statistics.median(run[field] for run in runs),
+            "min": min(run[field] for run in runs),
+            "max": max(run[field] for run in runs),
+        }
+        for field in ("preload_ms", "module_ms", "ark_first_use_ms")
+    }
+    eager = sorted({name for run in runs for name in run["eager"]})
+
+    if options.json:
+        print(json.dumps({"runs": runs, "summary": summary, "eager": eager}, indent=2))
+    else:
+        labels = {
+            "preload_ms": "torch/numpy/PIL (already loaded by ComfyUI)",
+            "module_ms": "seedream_node import (startup cost)",
+            "ark_first_use_ms": "Ark SDK import (deferred to first execution)",
+        }
+        print(f"{'':<46}{'median':>10}{'min':>10}{'max':>10}   ({options.runs} runs, ms)")
+        for field, label in labels.items():
+            stats = summary[field]
+            print(f"{label:<46}{stats['median']:>10.1f}{stats['min']:>10.1f}{stats['max']:>10.1f}")
+        print(f"eagerly imported at startup: {', '.join(eager) if eager else 'none'}")
+    return 1 if eager else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
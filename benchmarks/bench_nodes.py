@@ -0,0 +1,615 @@
+"""
+Offline benchmark for the Seedream / Seedance / TOS nodes.
+
+Starts a local stand-in for the Ark and TOS endpoints and drives the nodes end to end
+(node inputs -> SDK -> HTTP -> download/decode -> output tensors), so regressions in the
+encode, decode and download paths can be measured without calling the live API.
+
+    python benchmarks/bench_nodes.py
+    python benchmarks/bench_nodes.py -s seedream_b64 seedream_stream -n 20 --images 4 --image-size 2048x2048
+    python benchmarks/bench_nodes.py --latency-ms 0 --json > bench.json
+
+Every scenario runs in its own subprocess, so the reported peak RSS belongs to that scenario
+alone. The package requirements (torch, numpy, Pillow, requests, volcengine-python-sdk[ark],
+tos) must be installed; ComfyUI itself is not needed -- the worker installs a minimal
+folder_paths module pointing at a temporary directory.
+"""
+
+import argparse
+import asyncio
+import base64
+import contextlib
+import importlib.util
+import io
+import json
+import math
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import types
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMAGE_MODEL = "doubao-seedream-4-5-251128"
+VIDEO_MODEL = "doubao-seedance-2-0-260128"
+TOS_BUCKET = "bench-bucket"
+TOS_ENDPOINT = "tos-bench.local"
+TOS_REGION = "bench"
+
+
+# ---------------------------------------------------------------------------
+# Stand-in HTTP server
+# ---------------------------------------------------------------------------
+
+class MockServer(ThreadingHTTPServer):
+    """Serves the Ark image/task endpoints, result assets and a TOS-like object store"""
+
+    daemon_threads = True
+
+    def __init__(self, options):
+        super().__init__(("127.0.0.1", 0), MockHandler)
+        self.options = options
+        self.latency = options.latency_ms / 1000.0
+        self.image_bytes = make_image_bytes(options.image_size, options.image_format)
+        self.image_b64 = base64.b64encode(self.image_bytes).decode("ascii")
+        self.video_bytes = os.urandom(int(options.video_mb * 1024 * 1024))
+        self.tasks = {}
+        self.objects = {}
+        self.uploads = {}
+        self.lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_port}"
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    # -- helpers ----------------------------------------------------------
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length", 0) or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _send(self, status, body=b"", content_type="application/json", headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def _send_json(self, payload, status=200):
+        self._send(status, json.dumps(payload).encode("utf-8"))
+
+    def _api_latency(self):
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+    # -- routing ----------------------------------------------------------
+
+    def do_POST(self):
+        path = urlparse(self.path).path
+        if path.endswith("/images/generations"):
+            return self._images_generate(json.loads(self._read_body() or b"{}"))
+        if path.endswith("/contents/generations/tasks"):
+            return self._task_create(json.loads(self._read_body() or b"{}"))
+        if path.startswith("/tos/"):
+            return self._tos_post()
+        self._send(404)
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        match = re.search(r"/contents/generations/tasks/([^/]+)$", path)
+        if match:
+            return self._task_get(match.group(1))
+        if path.startswith("/assets/image/"):
+            return self._send(200, self.server.image_bytes, f"image/{self.server.options.image_format}")
+        if path == "/assets/video.mp4":
+            return self._send_ranged(self.server.video_bytes, "video/mp4")
+        self._send(404)
+
+    def do_HEAD(self):
+        path = urlparse(self.path).path
+        if path == "/assets/video.mp4":
+            if self.server.options.video_head == "reject":
+                # 方舟返回的视频地址是 TOS 预签名 GET URL，签名包含 HTTP 方法，HEAD 会被拒绝
+                return self._send(403)
+            return self._send_ranged(self.server.video_bytes, "video/mp4")
+        if path.startswith("/tos/"):
+            self._api_latency()
+            exists = path in self.server.objects
+            return self._send(200 if exists else 404)
+        self._send(404)
+
+    def do_PUT(self):
+        parsed = urlparse(self.path)
+        data = self._read_body()
+        self._api_latency()
+        query = parse_qs(parsed.query)
+        if "uploadId" in query:
+            with self.server.lock:
+                parts = self.server.uploads.setdefault(query["uploadId"][0], {})
+                parts[int(query["partNumber"][0])] = len(data)
+            return self._send(200, headers={"ETag": f'"{uuid.uuid4().hex}"'})
+        with self.server.lock:
+            self.server.objects[parsed.path] = len(data)
+        self._send(200, headers={"ETag": f'"{uuid.uuid4().hex}"'})
+
+    def do_DELETE(self):
+        query = parse_qs(urlparse(self.path).query)
+        with self.server.lock:
+            self.server.uploads.pop(query.get("uploadId", [""])[0], None)
+        self._send(204)
+
+    # -- Ark images -------------------------------------------------------
+
+    def _image_payload(self, index, response_format):
+        item = {"size": self.server.options.image_size, "url": None, "b64_json": None}
+        if response_format == "b64_json":
+            item["b64_json"] = self.server.image_b64
+        else:
+            item["url"] = f"{self.server.base_url}/assets/image/{uuid.uuid4().hex}_{index}.{self.server.options.image_format}"
+        return item
+
+    def _images_generate(self, body):
+        self._api_latency()
+        count = self.server.options.images
+        response_format = body.get("response_format") or "url"
+        created = int(time.time())
+        usage = {"generated_images": count, "output_tokens": 4096 * count, "total_tokens": 4096 * count}
+
+        if not body.get("stream"):
+            if self.server.options.event_interval_ms:
+                time.sleep(self.server.options.event_interval_ms * count / 1000.0)
+            data = [self._image_payload(i, response_format) for i in range(count)]
+            return self._send_json({"model": body.get("model"), "created": created, "data": data, "usage": usage})
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def emit(payload):
+            chunk = f"data: {payload}\n\n".encode("utf-8")
+            self.wfile.write(f"{len(chunk):x}\r\n".encode("ascii") + chunk + b"\r\n")
+            self.wfile.flush()
+
+        for i in range(count):
+            if self.server.options.event_interval_ms:
+                time.sleep(self.server.options.event_interval_ms / 1000.0)
+            event = {"type": "image_generation.partial_succeeded", "model": body.get("model"),
+                     "image_index": i, "created_at": created, "error": None}
+            event.update(self._image_payload(i, response_format))
+            emit(json.dumps(event))
+        emit(json.dumps({"type": "image_generation.completed", "model": body.get("model"),
+                         "created_at": created, "error": None, "usage": usage}))
+        emit("[DONE]")
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    # -- Ark content generation tasks ---------------------------------------
+
+    def _task_create(self, body):
+        self._api_latency()
+        task_id = f"cgt-bench-{uuid.uuid4().hex[:12]}"
+        with self.server.lock:
+            self.server.tasks[task_id] = {"model": body.get("model"), "created": time.time()}
+        self._send_json({"id": task_id})
+
+    def _task_get(self, task_id):
+        self._api_latency()
+        task = self.server.tasks.get(task_id)
+        if task is None:
+            return self._send_json({"error": {"code": "NotFound", "message": task_id}}, status=404)
+        done = time.time() - task["created"] >= self.server.options.task_seconds
+        payload = {
+            "id": task_id,
+            "model": task["model"],
+            "status": "succeeded" if done else "running",
+            "created_at": int(task["created"]),
+            "updated_at": int(time.time()),
+        }
+        if done:
+            payload.update({
+                "content": {"video_url": f"{self.server.base_url}/assets/video.mp4"},
+                "usage": {"completion_tokens": 100000, "total_tokens": 100000},
+                "seed": 1, "resolution": "720p", "ratio": "16:9", "duration": 5, "framespersecond": 24,
+            })
+        self._send_json(payload)
+
+    def _send_ranged(self, data, content_type):
+        match = re.match(r"bytes=(\d+)-(\d*)", self.headers.get("Range", ""))
+        headers = {"Accept-Ranges": "bytes"}
+        if not match:
+            return self._send(200, data, content_type, headers)
+        start = int(match.group(1))
+        end = int(match.group(2)) if match.group(2) else len(data) - 1
+        headers["Content-Range"] = f"bytes {start}-{end}/{len(data)}"
+        self._send(206, data[start:end + 1], content_type, headers)
+
+    # -- TOS multipart ------------------------------------------------------
+
+    def _tos_post(self):
+        parsed = urlparse(self.path)
+        query = parse_qs(parsed.query, keep_blank_values=True)
+        self._read_body()
+        self._api_latency()
+        if "uploads" in query:
+            upload_id = uuid.uuid4().hex
+            with self.server.lock:
+                self.server.uploads[upload_id] = {}
+            return self._send_json({"upload_id": upload_id})
+        upload_id = query.get("uploadId", [""])[0]
+        with self.server.lock:
+            parts = self.server.uploads.pop(upload_id, None)
+            if parts is None:
+                return self._send(404)
+            self.server.objects[parsed.path] = sum(parts.values())
+        self._send_json({"etag": uuid.uuid4().hex})
+
+
+def make_image_bytes(size, image_format):
+    """Noise image of the given WxH: compresses about as badly as a real photo"""
+    import numpy as np
+    from PIL import Image
+
+    width, height = (int(v) for v in size.lower().split("x"))
+    rng = np.random.default_rng(0)
+    # 低频渐变 + 噪声，编码体积接近真实生成图
+    gradient = np.linspace(0, 255, width, dtype=np.float32)[None, :, None]
+    pixels = gradient + rng.normal(0, 24, (height, width, 3)).astype(np.float32)
+    image = Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8))
+    buffer = io.BytesIO()
+    if image_format == "png":
+        image.save(buffer, format="PNG", compress_level=1)
+    else:
+        image.save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+# ---------------------------------------------------------------------------
+# Stand-in TOS client (injected into the node's TOS client cache)
+# ---------------------------------------------------------------------------
+
+class TosServerError(Exception):
+    """Matched by class name in TOSUploadVideoURL._object_exists"""
+
+    def __init__(self, status_code, code=""):
+        super().__init__(f"{status_code} {code}")
+        self.status_code = status_code
+        self.code = code
+
+
+class MockTosClient:
+    """Implements the TosClientV2 calls the upload node makes, against the mock server"""
+
+    def __init__(self, base_url):
+        import requests
+
+        self.base_url = base_url
+        self.session = requests.Session()
+
+    def _url(self, bucket, key):
+        return f"{self.base_url}/tos/{bucket}/{key}"
+
+    def put_object(self, bucket, key, content=None, content_type=None):
+        response = self.session.put(self._url(bucket, key), data=content, headers={"Content-Type": content_type or ""})
+        response.raise_for_status()
+        return types.SimpleNamespace(etag=response.headers.get("ETag"))
+
+    def head_object(self, bucket, key):
+        response = self.session.head(self._url(bucket, key))
+        if response.status_code == 404:
+            raise TosServerError(404, "NoSuchKey")
+        response.raise_for_status()
+        return types.SimpleNamespace(status_code=200)
+
+    def create_multipart_upload(self, bucket, key, content_type=None):
+        response = self.session.post(self._url(bucket, key) + "?uploads")
+        response.raise_for_status()
+        return types.SimpleNamespace(upload_id=response.json()["upload_id"])
+
+    def upload_part(self, bucket, key, upload_id, part_number, content=None):
+        response = self.session.put(
+            self._url(bucket, key), params={"uploadId": upload_id, "partNumber": part_number}, data=content
+        )
+        response.raise_for_status()
+        return types.SimpleNamespace(etag=response.headers.get("ETag"))
+
+    def complete_multipart_upload(self, bucket, key, upload_id, parts=None):
+        response = self.session.post(self._url(bucket, key), params={"uploadId": upload_id})
+        response.raise_for_status()
+        return types.SimpleNamespace(etag=response.json()["etag"])
+
+    def abort_multipart_upload(self, bucket, key, upload_id):
+        self.session.delete(self._url(bucket, key), params={"uploadId": upload_id})
+
+    def pre_signed_url(self, http_method, bucket, key, expires=3600):
+        # 真实 SDK 在本地计算签名，不访问网络
+        signature = uuid.uuid4().hex
+        return types.SimpleNamespace(signed_url=f"{self._url(bucket, key)}?X-Tos-Expires={expires}&X-Tos-Signature={signature}")
+
+
+# ---------------------------------------------------------------------------
+# Worker: runs one scenario in a fresh process
+# ---------------------------------------------------------------------------
+
+def install_folder_paths_shim(work_dir):
+    """Minimal stand-in for ComfyUI's folder_paths module"""
+    temp_dir = os.path.join(work_dir, "temp")
+    user_dir = os.path.join(work_dir, "user")
+    os.makedirs(temp_dir, exist_ok=True)
+    os.makedirs(user_dir, exist_ok=True)
+    folder_paths = types.ModuleType("folder_paths")
+    folder_paths.get_temp_directory = lambda: temp_dir
+    folder_paths.get_user_directory = lambda: user_dir
+    sys.modules["folder_paths"] = folder_paths
+
+
+def load_node_module():
+    spec = importlib.util.spec_from_file_location("seedream_node", os.path.join(ROOT, "seedream_node.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 以 KB 为单位，macOS 以字节为单位
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def random_image_tensor(size):
+    import torch
+
+    width, height = (int(v) for v in size.lower().split("x"))
+    return torch.rand((1, height, width, 3), dtype=torch.float32)
+
+
+def seedream_args(base_url, response_format, stream, max_images, **extra):
+    args = dict(
+        prompt="benchmark prompt", model=IMAGE_MODEL, aspect_ratio="1:1", sequential_image_generation="auto",
+        max_images=max_images, response_format=response_format, watermark=False, stream=stream, base_url=base_url,
+        use_local_images=True, seed=0, enable_auto_retry=False,
+    )
+    args.update(extra)
+    return args
+
+
+def build_scenario(name, node_module, api_base, server_base, options, work_dir):
+    """Return (description, run) where run() executes the node once and returns its metrics JSON"""
+    if name in ("seedream_url", "seedream_b64", "seedream_stream", "seedream_i2i"):
+        node = node_module.SeedreamImageGenerate()
+        response_format = "b64_json" if name == "seedream_b64" else "url"
+        stream = name == "seedream_stream"
+        description = f"{options.images} x {options.image_size} {response_format}" + (" stream" if stream else "")
+        if name == "seedream_i2i":
+            description += f", 1 x {options.input_size} input ({options.upload_codec})"
+
+        def run():
+            extra = {}
+            if name == "seedream_i2i":
+                extra = dict(image1=random_image_tensor(options.input_size), upload_codec=options.upload_codec)
+            images, _, metrics = node.generate_images(**seedream_args(api_base, response_format, stream, options.images, **extra))
+            assert len(images) == options.images, f"expected {options.images} images, got {len(images)}"
+            return metrics
+        return description, run
+
+    if name == "seedream_v2_stream_b64":
+        node = node_module.SeedreamImageGenerateV2()
+        description = f"V2 {options.images} x {options.image_size} b64_json stream"
+
+        def run():
+            args = seedream_args(api_base, "b64_json", True, options.images)
+            del args["aspect_ratio"]
+            # 请求的分辨率只需通过节点校验，返回图片的尺寸由 --image-size 决定
+            images, _, metrics = node.generate_images_v2(width=2048, height=2048, **args)
+            assert len(images) == options.images, f"expected {options.images} images, got {len(images)}"
+            return metrics
+        return description, run
+
+    if name == "seedance":
+        node = node_module.SeedanceVideoGenerate()
+        description = f"image-to-video, task {options.task_seconds}s, download {options.video_mb:g} MB"
+        video_size = int(options.video_mb * 1024 * 1024)
+        expected_ranges = node_module.VIDEO_DOWNLOAD_SEGMENTS if video_size >= node_module.VIDEO_DOWNLOAD_SEGMENT_MIN_BYTES else 1
+        download_range = node._download_range
+        range_calls = []
+
+        def counting_download_range(*args, **kwargs):
+            range_calls.append(args[3:5])
+            return download_range(*args, **kwargs)
+        node._download_range = counting_download_range
+
+        def run():
+            range_calls.clear()
+            result = asyncio.run(node.generate_video(
+                prompt="benchmark prompt", model=VIDEO_MODEL, duration=5, watermark=False, base_url=api_base,
+                poll_interval=1, max_wait_time=600, image=random_image_tensor(options.input_size),
+                download_video=True
+            ))
+            os.remove(result[2])
+            assert len(range_calls) == expected_ranges, f"expected {expected_ranges} download segments, got {len(range_calls)}"
+            return result[3]
+        return description, run
+
+    if name == "tos_upload":
+        node = node_module.TOSUploadVideoURL()
+        node_module._tos_clients[node_module._tos_credentials_scope(TOS_ENDPOINT, TOS_REGION)] = MockTosClient(server_base)
+        source_path = os.path.join(work_dir, "upload.mp4")
+        with open(source_path, "wb") as f:
+            f.write(os.urandom(int(options.upload_mb * 1024 * 1024)))
+        description = f"{options.upload_mb:g} MB file, reuse_existing=False"
+
+        def run():
+            result = node.upload_video(TOS_BUCKET, TOS_ENDPOINT, TOS_REGION, 3600, False, "bench/", file_path=source_path)
+            return result[4]
+        return description, run
+
+    raise ValueError(f"unknown scenario: {name}")
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(fraction * len(ordered)) - 1))]
+
+
+def run_worker(options):
+    work_dir = tempfile.mkdtemp(prefix="seedream-bench-")
+    try:
+        install_folder_paths_shim(work_dir)
+        os.environ["ARK_API_KEY"] = "bench-api-key"
+        os.environ["TOS_ACCESS_KEY"] = "bench-access-key"
+        os.environ["TOS_SECRET_KEY"] = "bench-secret-key"
+        os.environ.pop("SEEDREAM_METRICS_FILE", None)
+
+        # ComfyUI 在加载自定义节点前已导入 torch / numpy / PIL，计时只包含节点模块本身
+        import numpy  # noqa: F401
+        import torch  # noqa: F401
+        from PIL import Image  # noqa: F401
+        import_start = time.perf_counter()
+        node_module = load_node_module()
+        import_ms = (time.perf_counter() - import_start) * 1000
+        server_base = f"http://127.0.0.1:{options.port}"
+        description, run = build_scenario(
+            options.worker, node_module, f"{server_base}/api/v3", server_base, options, work_dir
+        )
+
+        quiet = contextlib.redirect_stdout(io.StringIO()) if not options.verbose else contextlib.nullcontext()
+        with quiet:
+            for _ in range(options.warmup):
+                run()
+        rss_before = peak_rss_mb()
+
+        latencies = []
+        phases = {}
+        total_start = time.perf_counter()
+        for _ in range(options.iterations):
+            with quiet:
+                start = time.perf_counter()
+                metrics = json.loads(run())
+                latencies.append((time.perf_counter() - start) * 1000)
+            for phase, stats in metrics["phases"].items():
+                phases[phase] = phases.get(phase, 0.0) + stats["total_ms"]
+        total_seconds = time.perf_counter() - total_start
+
+        print(json.dumps({
+            "scenario": options.worker,
+            "description": description,
+            "iterations": options.iterations,
+            "throughput_per_s": options.iterations / total_seconds,
+            "p50_ms": percentile(latencies, 0.50),
+            "p99_ms": percentile(latencies, 0.99),
+            "max_ms": max(latencies),
+            "peak_rss_mb": peak_rss_mb(),
+            "peak_rss_before_mb": rss_before,
+            "module_import_ms": import_ms,
+            "phases_mean_ms": {phase: total / options.iterations for phase, total in phases.items()},
+        }))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+# ---------------------------------------------------------------------------
+# Driver
+# ---------------------------------------------------------------------------
+
+SCENARIOS = [
+    "seedream_url", "seedream_b64", "seedream_stream", "seedream_i2i",
+    "seedream_v2_stream_b64", "seedance", "tos_upload",
+]
+
+
+def format_report(results):
+    lines = [
+        f"{'scenario':<24}{'ops/s':>8}{'p50 ms':>10}{'p99 ms':>10}{'peak MB':>10}{'import ms':>11}  description",
+        "-" * 100,
+    ]
+    for result in results:
+        if "error" in result:
+            lines.append(f"{result['scenario']:<24}  FAILED: {result['error']}")
+            continue
+        peak = result["peak_rss_mb"]
+        lines.append(
+            f"{result['scenario']:<24}{result['throughput_per_s']:>8.2f}{result['p50_ms']:>10.1f}{result['p99_ms']:>10.1f}"
+            f"{(f'{peak:.0f}' if peak is not None else 'n/a'):>10}{result['module_import_ms']:>11.0f}  {result['description']}"
+        )
+        phases = ", ".join(f"{phase} {ms:.1f}" for phase, ms in result["phases_mean_ms"].items())
+        lines.append(f"{'':<24}  phases (mean ms): {phases}")
+    return "\n".join(lines)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-s", "--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument("-n", "--iterations", type=int, default=10)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--images", type=int, choices=range(1, 11), default=4, metavar="1-10",
+                        help="images returned per generate call (the nodes' max_images range)")
+    parser.add_argument("--image-size", default="2048x2048", help="WxH of generated images")
+    parser.add_argument("--image-format", choices=["jpeg", "png"], default="jpeg")
+    parser.add_argument("--input-size", default="2048x2048", help="WxH of input image tensors")
+    parser.add_argument("--upload-codec", choices=["png", "jpeg", "webp", "auto"], default="png")
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="added to every API response")
+    parser.add_argument("--event-interval-ms", type=float, default=0.0, help="delay between generated images")
+    parser.add_argument("--task-seconds", type=float, default=0.0, help="time until a video task succeeds")
+    parser.add_argument("--video-mb", type=float, default=20.0)
+    parser.add_argument("--upload-mb", type=float, default=30.0)
+    parser.add_argument("--video-head", choices=["reject", "allow"], default="reject",
+                        help="how the video asset answers HEAD (presigned GET URLs reject it)")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    parser.add_argument("--verbose", action="store_true", help="keep the nodes' console output")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    options = parse_args(argv)
+    if options.worker:
+        return run_worker(options)
+
+    server = MockServer(options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    results = []
+    try:
+        for scenario in options.scenarios:
+            print(f"▶ {scenario} ...", file=sys.stderr)
+            completed = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), *argv, "--worker", scenario, "--port", str(server.server_port)],
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+            )
+            output = completed.stdout.strip().splitlines()
+            if completed.returncode != 0 or not output:
+                errors = [line for line in completed.stderr.splitlines() if line.strip()]
+                reason = errors[-1] if errors else f"worker exited with {completed.returncode}"
+                results.append({"scenario": scenario, "error": reason})
+                continue
+            results.append(json.loads(output[-1]))
+    finally:
+        server.shutdown()
+
+    print(json.dumps(results, indent=2) if options.json else format_report(results))
+
+
+if __name__ == "__main__":
+    main()
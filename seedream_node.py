@@ -1,20 +1,1048 @@
 import os
+import math
+import asyncio
+import weakref
 import mimetypes
-import wave
 import uuid
 import hashlib
+import json
+import shutil
+import tempfile
 import re
+import contextlib
+import glob
+import random
+from email.utils import parsedate_to_datetime
+from collections import OrderedDict, deque
+from types import SimpleNamespace
 from urllib.parse import urlparse
-import requests
 import torch
 import numpy as np
 from PIL import Image
 import io
+import binascii
 import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
 import folder_paths
-from volcenginesdkarkruntime import Ark
-from volcenginesdkarkruntime.types.images.images import SequentialImageGenerationOptions
-from volcenginesdkarkruntime.types.images.images import ContentGenerationTool
+# 火山方舟 SDK、requests、wave、TOS SDK 在首次执行节点时才导入（见 _import_ark / _import_tos），
+# 不拖慢 ComfyUI 启动；torch / numpy / PIL 已由 ComfyUI 自身加载，保持顶层导入
+
+# 结果图片下载：共享 keep-alive 连接池 + 有界并发
+DOWNLOAD_TIMEOUT = (10, 120)  # (连接超时, 读取超时) 秒
+MAX_DOWNLOAD_WORKERS = 6
+
+_http_session = None
+_http_session_lock = threading.Lock()
+
+
+_image_fetch_executor = None
+
+
+def _get_image_fetch_executor():
+    """Return the process-wide worker pool that downloads / decodes result images"""
+    global _image_fetch_executor
+    with _http_session_lock:
+        if _image_fetch_executor is None:
+            _image_fetch_executor = ThreadPoolExecutor(
+                max_workers=MAX_DOWNLOAD_WORKERS,
+                thread_name_prefix="seedream-fetch"
+            )
+        return _image_fetch_executor
+
+
+def _get_http_session():
+    """Return the process-wide requests.Session used for result downloads"""
+    global _http_session
+    with _http_session_lock:
+        if _http_session is None:
+            import requests
+            import requests.adapters
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(
+                pool_connections=4,
+                pool_maxsize=MAX_DOWNLOAD_WORKERS * 2
+            )
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _http_session = session
+        return _http_session
+
+def _import_ark():
+    """Import the Ark runtime SDK on first use; returns a namespace with the classes the nodes need"""
+    try:
+        from volcenginesdkarkruntime import Ark
+        from volcenginesdkarkruntime.types.images.images import SequentialImageGenerationOptions
+        from volcenginesdkarkruntime.types.images.images import ContentGenerationTool
+        from volcenginesdkarkruntime import _exceptions as errors
+    except ImportError as e:
+        raise ImportError(
+            "未安装火山方舟 Python SDK。请先执行 `pip install 'volcengine-python-sdk[ark]'`，或安装 requirements.txt 依赖。"
+        ) from e
+    return SimpleNamespace(
+        Ark=Ark,
+        SequentialImageGenerationOptions=SequentialImageGenerationOptions,
+        ContentGenerationTool=ContentGenerationTool,
+        errors=errors,
+    )
+
+# Ark 客户端池：按 (base_url, API Key 哈希) 复用，保留 HTTP 连接池与 TLS 会话
+# 回收只从池中移除引用、不调用 close()：仍持有该客户端的节点（如等待中的 Seedance 任务）可以继续使用，
+# 连接池在最后一个引用释放后由 GC 关闭。空闲超时须大于单次执行的最长占用时间（视频等待最长 3600 秒）。
+ARK_CLIENT_IDLE_TIMEOUT = 7200  # 秒，空闲超过该时间的客户端会从池中移除
+
+_ark_clients = {}
+_ark_clients_lock = threading.Lock()
+
+
+def _get_ark_client(base_url, api_key):
+    """Return a cached Ark client for (base_url, api_key), creating it on first use"""
+    base_url = base_url.strip()
+    key_hash = hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+    now = time.monotonic()
+    with _ark_clients_lock:
+        for cache_key, entry in list(_ark_clients.items()):
+            cached_url, cached_hash = cache_key
+            idle = now - entry["last_used"]
+            # 同一 base_url 的 Key 已轮换，或长时间空闲：从池中移除旧客户端
+            if (cached_url == base_url and cached_hash != key_hash) or idle > ARK_CLIENT_IDLE_TIMEOUT:
+                del _ark_clients[cache_key]
+        
+        entry = _ark_clients.get((base_url, key_hash))
+        if entry is None:
+            entry = {"client": _import_ark().Ark(base_url=base_url, api_key=api_key)}
+            _ark_clients[(base_url, key_hash)] = entry
+        entry["last_used"] = now
+        return entry["client"]
+
+
+class SeedreamValidationError(ValueError):
+    """Invalid node input or configuration; retrying the request cannot fix it"""
+
+
+class _RetryPolicy:
+    """
+    Classifies API errors and computes exponential backoff with full jitter.
+    Retry-After from rate-limit responses is respected, and the total sleep time of one
+    node run is capped by budget_seconds.
+    """
+    
+    RETRYABLE_CATEGORIES = ("rate_limit", "server", "timeout", "connection", "unknown")
+    
+    def __init__(self, base_delay=1.0, max_delay=30.0, budget_seconds=60.0):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget_seconds = budget_seconds
+        self.slept = 0.0
+    
+    @staticmethod
+    def _root_error(error):
+        """Follow the exception chain down to the SDK/HTTP error that carries a status code"""
+        seen = set()
+        while error is not None and id(error) not in seen:
+            seen.add(id(error))
+            if getattr(error, "status_code", None) is not None or isinstance(error, SeedreamValidationError):
+                return error
+            if error.__cause__ is None:
+                return error
+            error = error.__cause__
+        return error
+    
+    @staticmethod
+    def _is_ark_error(error, *names):
+        """isinstance check against the Ark SDK exception classes; False when the SDK is unavailable"""
+        try:
+            errors = _import_ark().errors
+        except ImportError:
+            return False
+        return isinstance(error, tuple(getattr(errors, name) for name in names))
+    
+    @classmethod
+    def classify(cls, error):
+        root = cls._root_error(error)
+        name = type(root).__name__
+        status = getattr(root, "status_code", None)
+        if status is None:
+            status = getattr(getattr(root, "response", None), "status_code", None)
+        
+        if isinstance(root, SeedreamValidationError):
+            return "validation"
+        if status == 429 or cls._is_ark_error(root, "ArkRateLimitError"):
+            return "rate_limit"
+        if status in (401, 403) or cls._is_ark_error(root, "ArkAuthenticationError", "ArkPermissionDeniedError"):
+            return "auth"
+        # ArkAPITimeoutError 是 ArkAPIConnectionError 的子类，需先判断
+        if cls._is_ark_error(root, "ArkAPITimeoutError") or "Timeout" in name or isinstance(root, TimeoutError):
+            return "timeout"
+        if cls._is_ark_error(root, "ArkAPIConnectionError") or isinstance(root, ConnectionError):
+            return "connection"
+        if (status is not None and status >= 500) or cls._is_ark_error(root, "ArkInternalServerError"):
+            return "server"
+        if status is not None and 400 <= status < 500:
+            return "validation"
+        return "unknown"
+    
+    @classmethod
+    def retry_after_seconds(cls, error):
+        response = getattr(cls._root_error(error), "response", None)
+        headers = getattr(response, "headers", None)
+        if not headers:
+            return None
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+    
+    def next_delay(self, category, attempt, error):
+        """Return the sleep before the next attempt, or None when the error must not be retried"""
+        if category not in self.RETRYABLE_CATEGORIES:
+            return None
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+        if category == "rate_limit":
+            retry_after = self.retry_after_seconds(error)
+            # 无 Retry-After 时限流错误至少等待一个基础间隔
+            delay = max(delay, retry_after if retry_after is not None else self.base_delay)
+        if self.slept + delay > self.budget_seconds:
+            return None
+        self.slept += delay
+        return delay
+
+
+# tensor <-> PIL 转换：分块量化，避免整图大小的 float 临时数组
+QUANTIZE_CHUNK_ELEMENTS = 1 << 20  # 每块最多处理的元素数（float32 约4MB）
+
+
+def _tensor_to_pil(tensor):
+    """
+    Convert a [H,W,C] float tensor in 0..1 to a PIL image.
+    Scaling and clipping run in place on a small row-block scratch buffer, so the only
+    full-size allocation is the uint8 result.
+    """
+    array = tensor.detach().cpu().numpy()
+    if array.dtype == np.uint8:
+        return Image.fromarray(array)
+    
+    result = np.empty(array.shape, dtype=np.uint8)
+    row_elements = max(1, int(np.prod(array.shape[1:])))
+    rows = max(1, QUANTIZE_CHUNK_ELEMENTS // row_elements)
+    scratch = np.empty((min(rows, array.shape[0]),) + array.shape[1:], dtype=np.float32)
+    for start in range(0, array.shape[0], rows):
+        block = array[start:start + rows]
+        buf = scratch[:block.shape[0]]
+        np.multiply(block, 255.0, out=buf)
+        np.clip(buf, 0, 255, out=buf)
+        np.copyto(result[start:start + rows], buf, casting='unsafe')
+    return Image.fromarray(result)
+
+
+def _pil_to_tensor(pil_image, out=None):
+    """
+    Convert a PIL image to a [1,H,W,C] float32 tensor in 0..1.
+    The uint8 pixels are read through the array interface without an extra numpy copy and
+    widened straight into out (a preallocated [1,H,W,C] float32 tensor or view) when given.
+    """
+    pixels = np.asarray(pil_image, dtype=np.uint8)
+    if pixels.ndim == 2:
+        pixels = pixels[..., None]
+    if out is None:
+        out = torch.empty((1,) + pixels.shape, dtype=torch.float32)
+    np.copyto(out[0].numpy(), pixels)
+    out.div_(255.0)
+    return out
+
+
+def _decode_b64_to_pil(b64_data):
+    """
+    Decode a base64 encoded image into an RGB PIL image.
+    a2b_base64 reads the str directly (b64decode first copies it to bytes), and the
+    compressed bytes are released as soon as the pixels are decoded.
+    """
+    stream = io.BytesIO(binascii.a2b_base64(b64_data))
+    try:
+        image = Image.open(stream)
+        image.load()
+    finally:
+        stream.close()
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    return image
+
+
+def _tensor_batch_to_pil(batch):
+    """Convert a [B,H,W,C] (or [H,W,C]) tensor to a list of PIL images"""
+    if batch.dim() == 3:
+        return [_tensor_to_pil(batch)]
+    return [_tensor_to_pil(frame) for frame in batch]
+
+
+def _pil_batch_to_tensor(pil_images):
+    """
+    Convert PIL images to a list of [1,H,W,C] float32 tensors. Same-sized images are written
+    into one [B,H,W,C] allocation and returned as views of it; mixed sizes are converted one by one.
+    """
+    if not pil_images:
+        return []
+    sizes = {(image.size, len(image.getbands())) for image in pil_images}
+    if len(sizes) > 1:
+        return [_pil_to_tensor(image) for image in pil_images]
+    (width, height), channels = sizes.pop()
+    batch = torch.empty((len(pil_images), height, width, channels), dtype=torch.float32)
+    for i, image in enumerate(pil_images):
+        _pil_to_tensor(image, out=batch[i:i + 1])
+    return list(batch.split(1))
+
+
+def _wait_until(condition, timeout, initial_probe=0.05, max_probe=1.0):
+    """
+    Probe condition() with exponentially growing gaps until it returns True or timeout elapses.
+    Returns (ready, waited_seconds).
+    """
+    start = time.monotonic()
+    probe = initial_probe
+    while True:
+        if condition():
+            return True, time.monotonic() - start
+        remaining = timeout - (time.monotonic() - start)
+        if remaining <= 0:
+            return False, time.monotonic() - start
+        time.sleep(min(probe, remaining))
+        probe = min(probe * 2, max_probe)
+
+
+# 输入图像质量校验
+VALIDATION_FULL_SCAN_ELEMENTS = 64 * 1024 * 1024  # 超过该元素数时改为等间隔抽样
+VALIDATION_SAMPLE_ELEMENTS = 4 * 1024 * 1024
+
+
+class _InputValidator:
+    """
+    Detects all-zero / NaN IMAGE tensors with one fused L1 reduction (no full-size boolean
+    temporaries); very large tensors are checked on a strided sample. Verdicts are cached by
+    tensor identity and in-place version counter, so retries do not rescan unchanged inputs.
+    """
+    
+    def __init__(self, max_entries=64):
+        self.max_entries = max_entries
+        self._verdicts = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def _cache_key(self, tensor):
+        return (id(tensor), getattr(tensor, "_version", None), tensor.data_ptr(), tuple(tensor.shape), str(tensor.dtype))
+    
+    def check_quality(self, tensor):
+        """Return "ok", "all_zero" or "nan" """
+        key = self._cache_key(tensor)
+        with self._lock:
+            entry = self._verdicts.get(key)
+            # 弱引用确认仍是同一个tensor对象，避免id被复用时误用旧结论
+            if entry is not None and entry[0]() is tensor:
+                self._verdicts.move_to_end(key)
+                return entry[1]
+        
+        values = tensor.detach()
+        if values.numel() > VALIDATION_FULL_SCAN_ELEMENTS:
+            stride = values.numel() // VALIDATION_SAMPLE_ELEMENTS
+            values = values.reshape(-1)[::stride]
+        if not values.is_floating_point():
+            values = values.float()
+        # sum(|x|)：NaN会传播，全零时为0，一次归约同时完成两项检查
+        total = float(torch.linalg.vector_norm(values, ord=1))
+        if math.isnan(total):
+            verdict = "nan"
+        elif total == 0:
+            verdict = "all_zero"
+        else:
+            verdict = "ok"
+        
+        try:
+            tensor_ref = weakref.ref(tensor)
+        except TypeError:
+            return verdict
+        with self._lock:
+            self._verdicts[key] = (tensor_ref, verdict)
+            while len(self._verdicts) > self.max_entries:
+                self._verdicts.popitem(last=False)
+        return verdict
+
+
+_input_validator = _InputValidator()
+
+
+# 参考图上传编码
+UPLOAD_CODECS = ["png", "jpeg", "webp", "auto"]
+UPLOAD_CODEC_MIME_TYPES = {"png": "image/png", "jpeg": "image/jpeg", "webp": "image/webp"}
+
+
+def _encode_pil_image(pil_image, codec="png", quality=90):
+    """
+    Encode a PIL image as a base64 data URL.
+    codec="auto" tries the lossy codecs at the given quality and keeps the smallest payload.
+    Returns (data_url, stats) where stats holds codec, byte size and encode time.
+    """
+    import base64
+    
+    if pil_image.mode != 'RGB':
+        pil_image = pil_image.convert('RGB')
+    
+    start = time.perf_counter()
+    candidates = ["jpeg", "webp"] if codec == "auto" else [codec]
+    best_codec, best_bytes = None, None
+    for candidate in candidates:
+        buffered = io.BytesIO()
+        try:
+            if candidate == "jpeg":
+                pil_image.save(buffered, format="JPEG", quality=quality)
+            elif candidate == "webp":
+                pil_image.save(buffered, format="WEBP", quality=quality, method=4)
+            elif candidate == "png":
+                pil_image.save(buffered, format="PNG")
+            else:
+                raise SeedreamValidationError(f"不支持的上传编码: {candidate}")
+        except (OSError, KeyError):
+            # 当前Pillow未编译该编码器（例如WebP）时，auto模式跳过该候选
+            if codec != "auto":
+                raise
+            continue
+        img_bytes = buffered.getvalue()
+        if best_bytes is None or len(img_bytes) < len(best_bytes):
+            best_codec, best_bytes = candidate, img_bytes
+    
+    if best_bytes is None:
+        # auto模式下所有有损编码器都不可用，回退到PNG
+        buffered = io.BytesIO()
+        pil_image.save(buffered, format="PNG")
+        best_codec, best_bytes = "png", buffered.getvalue()
+    
+    encode_ms = (time.perf_counter() - start) * 1000
+    img_base64 = base64.b64encode(best_bytes).decode('utf-8')
+    data_url = f"data:{UPLOAD_CODEC_MIME_TYPES[best_codec]};base64,{img_base64}"
+    stats = {
+        "size": pil_image.size,
+        "codec": best_codec,
+        "bytes": len(best_bytes),
+        "encode_ms": encode_ms,
+    }
+    return data_url, stats
+
+
+def _format_upload_stats(upload_stats, cache_stats=None):
+    """Render per-image encode stats (and encode cache hits/misses) as text lines"""
+    lines = []
+    total_bytes = sum(item["bytes"] for item in upload_stats)
+    total_ms = sum(item["encode_ms"] for item in upload_stats if not item.get("cached"))
+    lines.append(f"📦 上传编码: {len(upload_stats)}张, 共 {total_bytes / 1024:.1f} KB, 编码耗时 {total_ms:.1f} ms")
+    if cache_stats is not None:
+        lines.append(f"🗃️ 编码缓存: 命中 {cache_stats['hits']}, 未命中 {cache_stats['misses']}")
+    for i, item in enumerate(upload_stats):
+        if item.get("cached"):
+            line = f"   └─ 图像{i+1}: {item['codec']}, {item['bytes'] / 1024:.1f} KB, 缓存命中"
+        else:
+            line = f"   └─ 图像{i+1}: {item['codec']}, {item['bytes'] / 1024:.1f} KB, {item['encode_ms']:.1f} ms"
+        if item.get("resized_from"):
+            src_w, src_h = item["resized_from"]
+            dst_w, dst_h = item["size"]
+            line += f", 缩放 {src_w}x{src_h} → {dst_w}x{dst_h}"
+        lines.append(line)
+    return lines
+
+
+# 参考图编码结果缓存：内容寻址，按 data URL 字节数做 LRU 淘汰
+ENCODED_IMAGE_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+
+class _EncodedImageCache:
+    """Thread-safe LRU of finished data URLs, bounded by total bytes"""
+    
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+    
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+    
+    def put(self, key, data_url, stats):
+        size = len(data_url)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._total_bytes -= len(old[0])
+            self._entries[key] = (data_url, stats)
+            self._total_bytes += size
+            while self._total_bytes > self.max_bytes and self._entries:
+                _, (evicted_url, _) = self._entries.popitem(last=False)
+                self._total_bytes -= len(evicted_url)
+
+
+_encoded_image_cache = _EncodedImageCache(ENCODED_IMAGE_CACHE_MAX_BYTES)
+
+
+def _tensor_digest(tensor):
+    """Fast content hash of an image tensor (shape, dtype and raw bytes)"""
+    array = np.ascontiguousarray(tensor.detach().cpu().numpy())
+    hasher = hashlib.blake2b(digest_size=20)
+    hasher.update(f"{array.shape}|{array.dtype}".encode("utf-8"))
+    hasher.update(memoryview(array).cast("B"))
+    return hasher.hexdigest()
+
+
+# 请求级结果缓存（可选）：相同请求参数 + 输入图直接返回磁盘上的结果图
+RESULT_CACHE_MAX_BYTES = 2 * 1024 * 1024 * 1024
+RESULT_CACHE_MAX_TTL = 720 * 3600  # 未记录过期时间的旧条目按最长有效期处理
+RESULT_CACHE_PRUNE_INTERVAL = 600  # 秒，两次全量扫描过期条目的最小间隔
+RESULT_CACHE_STALE_TMP_SECONDS = 3600  # 崩溃残留的 .tmp 目录超过该时间后删除
+
+
+def _user_data_directory():
+    """ComfyUI user directory for persistent node data (temp directory on older ComfyUI)"""
+    get_user_directory = getattr(folder_paths, "get_user_directory", None)
+    return get_user_directory() if callable(get_user_directory) else folder_paths.get_temp_directory()
+
+
+def _to_jsonable(value):
+    """Reduce SDK option objects and containers to plain JSON values for hashing"""
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    if isinstance(value, dict):
+        return {str(k): _to_jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_to_jsonable(v) for v in value]
+    for attr in ("model_dump", "dict"):
+        dump = getattr(value, attr, None)
+        if callable(dump):
+            try:
+                return _to_jsonable(dump())
+            except Exception:
+                pass
+    if hasattr(value, "__dict__"):
+        return _to_jsonable(vars(value))
+    return repr(value)
+
+
+class _ResultCache:
+    """
+    On-disk cache of generated images under ComfyUI's user directory.
+    Each entry is <root>/<key>/meta.json plus one PNG per image; meta.json mtime is the LRU clock.
+    meta.json records the entry's own expiry and size, so nodes with different TTLs share one cache.
+    """
+    
+    IMAGE_INFO_FIELDS = ("url", "size", "revised_prompt", "finish_reason")
+    
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._prune_lock = threading.Lock()
+        self._total_bytes = None  # 近似的缓存总大小，None 表示尚未扫描
+        self._last_prune = 0.0
+    
+    def root(self):
+        return os.path.join(_user_data_directory(), "seedream_result_cache")
+    
+    def make_key(self, generate_params, seed):
+        canonical = {}
+        for name, value in generate_params.items():
+            if name == "image":
+                # 输入图用摘要参与哈希，避免把数MB的data URL写入key
+                value = [hashlib.sha256(url.encode("utf-8")).hexdigest() for url in value]
+            canonical[name] = _to_jsonable(value)
+        canonical["seed"] = seed
+        payload = json.dumps(canonical, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+    
+    @staticmethod
+    def _expires_at(meta, default_ttl):
+        expires = meta.get("expires")
+        if expires is None:
+            expires = meta.get("created", 0) + default_ttl
+        return expires
+    
+    @staticmethod
+    def _entry_size(entry_dir):
+        try:
+            return sum(os.path.getsize(os.path.join(entry_dir, f)) for f in os.listdir(entry_dir))
+        except OSError:
+            return 0
+    
+    def load(self, key, ttl_seconds):
+        """Return (pil_images, image_records) for a fresh entry, or None (ttl_seconds applies to entries without a stored expiry)"""
+        entry_dir = os.path.join(self.root(), key)
+        meta_path = os.path.join(entry_dir, "meta.json")
+        with self._lock:
+            try:
+                with open(meta_path, "r", encoding="utf-8") as f:
+                    meta = json.load(f)
+            except (OSError, ValueError):
+                return None
+            if time.time() > self._expires_at(meta, ttl_seconds):
+                shutil.rmtree(entry_dir, ignore_errors=True)
+                return None
+            try:
+                pil_images = []
+                for record in meta["images"]:
+                    with Image.open(os.path.join(entry_dir, record["file"])) as image:
+                        pil_images.append(image.convert("RGB"))
+            except (OSError, KeyError) as e:
+                print(f"⚠️ 结果缓存条目损坏，已删除: {e}")
+                shutil.rmtree(entry_dir, ignore_errors=True)
+                return None
+            os.utime(meta_path)
+        records = [SimpleNamespace(**record["info"]) for record in meta["images"]]
+        return pil_images, records
+    
+    def store(self, key, pil_images, image_records, ttl_seconds):
+        root = self.root()
+        entry_dir = os.path.join(root, key)
+        tmp_dir = os.path.join(root, f".{key}.{uuid.uuid4().hex[:8]}.tmp")
+        os.makedirs(tmp_dir, exist_ok=True)
+        try:
+            images_meta = []
+            for i, (image, record) in enumerate(zip(pil_images, image_records)):
+                filename = f"{i}.png"
+                image.save(os.path.join(tmp_dir, filename), format="PNG", compress_level=1)
+                info = {field: getattr(record, field, None) for field in self.IMAGE_INFO_FIELDS}
+                images_meta.append({"file": filename, "info": info})
+            size = self._entry_size(tmp_dir)
+            created = time.time()
+            meta = {"created": created, "expires": created + ttl_seconds, "size": size, "images": images_meta}
+            with open(os.path.join(tmp_dir, "meta.json"), "w", encoding="utf-8") as f:
+                json.dump(meta, f, ensure_ascii=False)
+            with self._lock:
+                replaced_size = self._entry_size(entry_dir) if os.path.isdir(entry_dir) else 0
+                shutil.rmtree(entry_dir, ignore_errors=True)
+                os.replace(tmp_dir, entry_dir)
+                if self._total_bytes is not None:
+                    self._total_bytes += size - replaced_size
+                due = (
+                    self._total_bytes is None or self._total_bytes > self.max_bytes
+                    or created - self._last_prune >= RESULT_CACHE_PRUNE_INTERVAL
+                )
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        if due:
+            self.prune()
+    
+    def _remove_if_unchanged(self, entry_dir, last_used):
+        """Remove an entry unless it was read or rewritten since the scan; call with self._lock held"""
+        try:
+            if os.path.getmtime(os.path.join(entry_dir, "meta.json")) != last_used:
+                return False
+        except OSError:
+            return False
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        return True
+    
+    def prune(self):
+        """
+        Drop expired entries and stale .tmp directories, then the least recently used entries until
+        under max_bytes. The directory walk runs without holding the lock, so concurrent loads are
+        not blocked; only one thread prunes at a time.
+        """
+        if not self._prune_lock.acquire(blocking=False):
+            return
+        try:
+            root = self.root()
+            now = time.time()
+            expired = []
+            entries = []
+            for name in os.listdir(root):
+                entry_dir = os.path.join(root, name)
+                if name.startswith("."):
+                    # 写入过程中崩溃残留的临时目录
+                    try:
+                        if name.endswith(".tmp") and now - os.path.getmtime(entry_dir) > RESULT_CACHE_STALE_TMP_SECONDS:
+                            shutil.rmtree(entry_dir, ignore_errors=True)
+                    except OSError:
+                        pass
+                    continue
+                meta_path = os.path.join(entry_dir, "meta.json")
+                try:
+                    last_used = os.path.getmtime(meta_path)
+                    with open(meta_path, "r", encoding="utf-8") as f:
+                        meta = json.load(f)
+                except (OSError, ValueError):
+                    continue
+                size = meta.get("size")
+                if size is None:
+                    size = self._entry_size(entry_dir)
+                if now > self._expires_at(meta, RESULT_CACHE_MAX_TTL):
+                    expired.append((last_used, size, entry_dir))
+                else:
+                    entries.append((last_used, size, entry_dir))
+            
+            total_bytes = sum(size for _, size, _ in entries)
+            with self._lock:
+                for last_used, _, entry_dir in expired:
+                    self._remove_if_unchanged(entry_dir, last_used)
+                for last_used, size, entry_dir in sorted(entries):
+                    if total_bytes <= self.max_bytes:
+                        break
+                    if self._remove_if_unchanged(entry_dir, last_used):
+                        total_bytes -= size
+                self._total_bytes = total_bytes
+                self._last_prune = now
+        finally:
+            self._prune_lock.release()
+
+
+_result_cache = _ResultCache(RESULT_CACHE_MAX_BYTES)
+
+
+class _RequestBudget:
+    """Sliding-window limiter: at most max_per_minute acquire() calls in any 60 second window"""
+    
+    def __init__(self, max_per_minute):
+        self.max_per_minute = max_per_minute
+        self._starts = deque()
+        self._lock = threading.Lock()
+    
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                while self._starts and now - self._starts[0] >= 60:
+                    self._starts.popleft()
+                if len(self._starts) < self.max_per_minute:
+                    self._starts.append(now)
+                    return
+                wait = 60 - (now - self._starts[0])
+            time.sleep(max(wait, 0.05))
+
+
+
+# 全局 API 限流：按 (base_url, model) 共享的令牌桶 + 在途请求上限，所有节点实例共用
+# SEEDREAM_API_RPM            每分钟请求数上限（0 或未设置表示不限）
+# SEEDREAM_API_BURST          令牌桶容量，允许的瞬时突发请求数（默认 1，即均匀放行）
+# SEEDREAM_API_MAX_IN_FLIGHT  同时在途的请求数上限（0 或未设置表示不限）
+# SEEDREAM_API_LIMITS         按模型覆盖上述配置的 JSON，例如 {"doubao-seedance-2-0-260128": {"rpm": 10, "max_in_flight": 2}}
+# SEEDREAM_API_LOCK_DIR       设置后改用该目录下的文件锁在多个 ComfyUI 进程之间共享限额
+API_RATE_LIMIT_POLL_INTERVAL = 0.05  # 秒，跨进程模式下等待在途名额的探测间隔
+
+
+def _api_limits_for(model):
+    """Read the configured limits for model from the environment: (rpm, burst, max_in_flight)"""
+    def number(value, cast):
+        try:
+            return max(0, cast(value))
+        except (TypeError, ValueError):
+            return 0
+    
+    limits = {
+        "rpm": os.environ.get("SEEDREAM_API_RPM"),
+        "burst": os.environ.get("SEEDREAM_API_BURST"),
+        "max_in_flight": os.environ.get("SEEDREAM_API_MAX_IN_FLIGHT"),
+    }
+    overrides = os.environ.get("SEEDREAM_API_LIMITS", "").strip()
+    if overrides:
+        try:
+            model_limits = json.loads(overrides).get(model) or {}
+        except (ValueError, AttributeError) as e:
+            print(f"⚠️ SEEDREAM_API_LIMITS 不是有效的 JSON 对象，已忽略: {e}")
+        else:
+            if isinstance(model_limits, dict):
+                limits.update(model_limits)
+            else:
+                print(f"⚠️ SEEDREAM_API_LIMITS 中 {model} 的配置应为对象（如 {{\"rpm\": 60}}），已忽略: {model_limits!r}")
+    return number(limits["rpm"], float), max(1, number(limits["burst"], int)), number(limits["max_in_flight"], int)
+
+
+def _try_lock_file(f):
+    """Take a non-blocking exclusive lock on an open file; False when another holder has it"""
+    try:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        return True
+    except OSError:
+        return False
+
+
+def _unlock_file(f):
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class _ApiSlot:
+    """Handle for one admitted API call; release() frees its in-flight slot (idempotent)"""
+    
+    def __init__(self, waited, release=None):
+        self.waited = waited
+        self._release = release
+    
+    def release(self):
+        release, self._release = self._release, None
+        if release is not None:
+            release()
+
+
+class _ApiGovernor:
+    """
+    Token bucket (rpm, burst) plus in-flight limit for one (base_url, model).
+    In-process state by default; with lock_dir the bucket lives in a file guarded by an OS file
+    lock and in-flight slots are lock files, so several processes share one budget and a crashed
+    process never leaks a slot.
+    """
+    
+    def __init__(self, key, rpm, burst, max_in_flight, lock_dir=None):
+        self.rate = rpm / 60.0
+        self.burst = burst
+        self.max_in_flight = max_in_flight
+        self._lock = threading.Lock()
+        self._tokens = float(burst)
+        self._updated = time.time()
+        self._blocked_until = 0.0
+        self._in_flight = threading.BoundedSemaphore(max_in_flight) if max_in_flight and not lock_dir else None
+        self._file_prefix = None
+        if lock_dir:
+            os.makedirs(lock_dir, exist_ok=True)
+            self._file_prefix = os.path.join(lock_dir, "seedream_api_" + hashlib.sha256(key.encode("utf-8")).hexdigest()[:16])
+    
+    @property
+    def enabled(self):
+        return self.rate > 0 or self.max_in_flight > 0
+    
+    # -- token bucket --------------------------------------------------------
+    
+    def _take_token(self, state):
+        """Refill state {tokens, updated, blocked_until} and take one token; returns the wait when none is available"""
+        now = time.time()
+        if now < state["blocked_until"]:
+            return state["blocked_until"] - now
+        if self.rate <= 0:
+            return 0.0
+        state["tokens"] = min(self.burst, state["tokens"] + (now - state["updated"]) * self.rate)
+        state["updated"] = now
+        if state["tokens"] >= 1:
+            state["tokens"] -= 1
+            return 0.0
+        return (1 - state["tokens"]) / self.rate
+    
+    @contextlib.contextmanager
+    def _shared_state(self):
+        """Yield the bucket state dict; saved back afterwards (file-backed in cross-process mode)"""
+        if self._file_prefix is None:
+            with self._lock:
+                state = {"tokens": self._tokens, "updated": self._updated, "blocked_until": self._blocked_until}
+                yield state
+                self._tokens, self._updated, self._blocked_until = state["tokens"], state["updated"], state["blocked_until"]
+            return
+        
+        with self._lock, open(self._file_prefix + ".bucket", "a+", encoding="utf-8") as f:
+            while not _try_lock_file(f):
+                time.sleep(0.005)
+            try:
+                f.seek(0)
+                try:
+                    state = json.loads(f.read() or "{}")
+                except ValueError:
+                    state = {}
+                state = {
+                    "tokens": float(state.get("tokens", self.burst)),
+                    "updated": float(state.get("updated", time.time())),
+                    "blocked_until": float(state.get("blocked_until", 0.0)),
+                }
+                yield state
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps(state))
+                f.flush()
+            finally:
+                _unlock_file(f)
+    
+    def pause(self, seconds):
+        """Hold back every caller of this key for seconds (e.g. after a 429 with Retry-After)"""
+        with self._shared_state() as state:
+            state["blocked_until"] = max(state["blocked_until"], time.time() + seconds)
+    
+    # -- in-flight slots -----------------------------------------------------
+    
+    def _acquire_file_slot(self):
+        while True:
+            for index in range(self.max_in_flight):
+                f = open(f"{self._file_prefix}.slot{index}", "a+")
+                if _try_lock_file(f):
+                    def release(f=f):
+                        try:
+                            _unlock_file(f)
+                        finally:
+                            f.close()
+                    return release
+                f.close()
+            time.sleep(API_RATE_LIMIT_POLL_INTERVAL)
+    
+    def acquire(self, timer=None):
+        """
+        Block until an in-flight slot and a token are available; returns an _ApiSlot.
+        Waits are recorded on timer as a rate_limit_wait span.
+        """
+        start = time.monotonic()
+        release = None
+        if self.max_in_flight:
+            if self._in_flight is not None:
+                self._in_flight.acquire()
+                release = self._in_flight.release
+            else:
+                release = self._acquire_file_slot()
+        try:
+            while True:
+                with self._shared_state() as state:
+                    wait = self._take_token(state)
+                if wait <= 0:
+                    break
+                time.sleep(min(wait, 1.0))
+        except BaseException:
+            release and release()
+            raise
+        waited = time.monotonic() - start
+        if timer is not None and waited > 0.001:
+            timer.add("rate_limit_wait", time.perf_counter() - waited)
+        return _ApiSlot(waited, release)
+    
+    @contextlib.contextmanager
+    def slot(self, timer=None):
+        """Context manager form of acquire()"""
+        api_slot = self.acquire(timer)
+        try:
+            yield api_slot
+        finally:
+            api_slot.release()
+
+
+_api_governors = {}
+_api_governors_lock = threading.Lock()
+
+
+def _get_api_governor(base_url, model):
+    """Return the process-wide governor for (base_url, model), configured from the environment"""
+    key = f"{(base_url or '').strip().rstrip('/')}|{model}"
+    lock_dir = os.environ.get("SEEDREAM_API_LOCK_DIR", "").strip() or None
+    limits = _api_limits_for(model) + (lock_dir,)
+    with _api_governors_lock:
+        entry = _api_governors.get(key)
+        # 配置变化（环境变量被修改）时重建
+        if entry is None or entry[0] != limits:
+            entry = (limits, _ApiGovernor(key, *limits))
+            _api_governors[key] = entry
+        return entry[1]
+
+# 阶段计时：每次节点执行记录各阶段耗时，写入 text / metrics 输出，可选追加到本地 JSONL 文件
+METRICS_FILE_ENV = "SEEDREAM_METRICS_FILE"
+
+_metrics_file_lock = threading.Lock()
+
+
+class _PhaseTimer:
+    """
+    Wall-clock spans for the phases of one node execution.
+    Spans may be recorded from worker threads; child() shares the span list and tags every
+    span it records with extra attributes (fan-out job, image index, file...).
+    """
+    
+    def __init__(self, node, _spans=None, _lock=None, _attrs=None, _origin=None):
+        self.node = node
+        self.started_at = time.time()
+        self._origin = _origin if _origin is not None else time.perf_counter()
+        self._spans = _spans if _spans is not None else []
+        self._lock = _lock or threading.Lock()
+        self._attrs = _attrs or {}
+    
+    def child(self, **attrs):
+        return _PhaseTimer(self.node, self._spans, self._lock, {**self._attrs, **attrs}, self._origin)
+    
+    def add(self, name, start, end=None, **attrs):
+        """Record a span between two time.perf_counter() readings (end defaults to now)"""
+        end = time.perf_counter() if end is None else end
+        span = {
+            "name": name,
+            "start_ms": round((start - self._origin) * 1000, 2),
+            "duration_ms": round((end - start) * 1000, 2),
+            **self._attrs,
+            **attrs,
+        }
+        with self._lock:
+            self._spans.append(span)
+    
+    @contextlib.contextmanager
+    def span(self, name, **attrs):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, start, **attrs)
+    
+    def phases(self):
+        """Per-phase totals in first-seen order: name -> {count, total_ms, max_ms}"""
+        summary = {}
+        with self._lock:
+            spans = list(self._spans)
+        for span in spans:
+            phase = summary.setdefault(span["name"], {"count": 0, "total_ms": 0.0, "max_ms": 0.0})
+            phase["count"] += 1
+            phase["total_ms"] = round(phase["total_ms"] + span["duration_ms"], 2)
+            phase["max_ms"] = max(phase["max_ms"], span["duration_ms"])
+        return summary
+    
+    def to_dict(self, status="ok"):
+        with self._lock:
+            spans = list(self._spans)
+        return {
+            "node": self.node,
+            "status": status,
+            "started_at": self.started_at,
+            "total_ms": round((time.perf_counter() - self._origin) * 1000, 2),
+            "phases": self.phases(),
+            "spans": spans,
+        }
+    
+    def summary_lines(self):
+        lines = [f"⏱️ 阶段耗时 (总计 {time.perf_counter() - self._origin:.2f} 秒):"]
+        for name, phase in self.phases().items():
+            line = f"   - {name}: {phase['total_ms']:.1f} ms"
+            if phase["count"] > 1:
+                line += f" (x{phase['count']}, 最长 {phase['max_ms']:.1f} ms)"
+            lines.append(line)
+        return lines
+    
+    def finish(self, status="ok"):
+        """Return the metrics JSON string and append it to $SEEDREAM_METRICS_FILE when set"""
+        metrics = self.to_dict(status)
+        metrics_json = json.dumps(metrics, ensure_ascii=False, default=str)
+        metrics_file = os.environ.get(METRICS_FILE_ENV, "").strip()
+        if metrics_file:
+            try:
+                with _metrics_file_lock, open(metrics_file, "a", encoding="utf-8") as f:
+                    f.write(metrics_json + "\n")
+            except OSError as e:
+                print(f"⚠️ 写入指标文件失败 ({metrics_file}): {e}")
+        return metrics_json
+
+
+def _span(timer, name, **attrs):
+    """timer.span(...) or a no-op context when no timer is attached"""
+    return timer.span(name, **attrs) if timer is not None else contextlib.nullcontext()
 
 class SeedreamImageGenerate:
     """
@@ -22,6 +1050,14 @@ class SeedreamImageGenerate:
     """
     
     SEEDREAM_5_PRO_MODEL = "doubao-seedream-5-0-pro-260628"
+    MIN_TOTAL_PIXELS = 2560 * 1440
+    MAX_TOTAL_PIXELS = 4096 * 4096
+    MODEL_TOTAL_PIXEL_LIMITS = {
+        "doubao-seedream-5-0-pro-260628": ((1280 * 720), (2048 * 2048), "1280x720", "2048x2048"),
+        "doubao-seedream-5-0-260128": ((2560 * 1440), (4096 * 4096), "2560x1440", "4096x4096"),
+        "doubao-seedream-4-5-251128": ((2560 * 1440), (4096 * 4096), "2560x1440", "4096x4096"),
+        "doubao-seedream-4-0-250828": ((1280 * 720), (4096 * 4096), "1280x720", "4096x4096"),
+    }
     
     @classmethod
     def INPUT_TYPES(cls):
@@ -82,104 +1118,154 @@ class SeedreamImageGenerate:
                 "image2": ("IMAGE",),
                 "image3": ("IMAGE",),
                 "image4": ("IMAGE",),
-                "image5": ("IMAGE",)
+                "image5": ("IMAGE",),
+                **cls._extra_optional_inputs()
             }
         }
     
-    RETURN_TYPES = ("IMAGE", "STRING")
-    RETURN_NAMES = ("images", "text")
-    OUTPUT_IS_LIST = (True, False)
+    @classmethod
+    def _extra_optional_inputs(cls):
+        """Optional tuning inputs shared by every Seedream image node"""
+        return {
+            "upload_codec": (UPLOAD_CODECS, {
+                "default": "png",
+                "tooltip": "参考图上传编码：png=无损；jpeg/webp=有损，体积更小、编码更快；auto=按 upload_quality 选择体积最小的有损编码"
+            }),
+            "upload_quality": ("INT", {
+                "default": 90,
+                "min": 50,
+                "max": 100,
+                "step": 1,
+                "tooltip": "jpeg/webp/auto 编码质量"
+            }),
+            "downscale_inputs": ("BOOLEAN", {
+                "default": False,
+                "tooltip": "上传前将超过模型总像素上限的参考图等比缩小，减少编码耗时与上传体积"
+            }),
+            "enable_result_cache": ("BOOLEAN", {
+                "default": False,
+                "tooltip": "启用结果缓存：相同的提示词/模型/尺寸/输入图/种子/水印等参数直接返回磁盘缓存的图片，不再调用API"
+            }),
+            "result_cache_ttl_hours": ("INT", {
+                "default": 24,
+                "min": 1,
+                "max": 720,
+                "step": 1,
+                "tooltip": "结果缓存有效期（小时）"
+            }),
+            "batch_mode": ("BOOLEAN", {
+                "default": False,
+                "tooltip": "批处理模式：IMAGE输入为多帧batch时，每一帧作为独立请求并发生成，输出按帧顺序汇总；关闭时只使用第1帧"
+            }),
+            "prompt_list_mode": ("BOOLEAN", {
+                "default": False,
+                "tooltip": "提示词列表模式：prompt 中每个非空行作为一条独立提示词并发生成，返回全部图片和逐条汇总"
+            }),
+            "max_concurrency": ("INT", {
+                "default": 4,
+                "min": 1,
+                "max": 32,
+                "step": 1,
+                "tooltip": "批处理/提示词列表模式下同时进行的最大请求数"
+            }),
+            "requests_per_minute": ("INT", {
+                "default": 0,
+                "min": 0,
+                "max": 6000,
+                "step": 1,
+                "tooltip": "批处理/提示词列表模式下每分钟最多发起的请求数，0 表示不限制"
+            }),
+        }
+    
+    RETURN_TYPES = ("IMAGE", "STRING", "STRING")
+    RETURN_NAMES = ("images", "text", "metrics")
+    OUTPUT_IS_LIST = (True, False, False)
     FUNCTION = "generate_images"
     CATEGORY = "image/generation"
     
     def __init__(self):
         self.client = None
         self.max_retries = 3
-        self.retry_delay = 1.0  # 秒
+        self.retry_delay = 1.0  # 秒，指数退避的基础间隔
+        self.retry_max_delay = 30.0  # 秒，单次退避上限
+        self.retry_budget = 60.0  # 秒，单次执行内所有重试等待时间之和的上限
+        self.input_ready_timeout = 3.0  # 秒，等待上游写入图像数据的最长时间
     
     def tensor_to_pil(self, tensor):
         """Convert ComfyUI tensor to PIL Image"""
-        # Convert tensor to numpy array
-        i = 255. * tensor.cpu().numpy()
-        img = Image.fromarray(np.clip(i, 0, 255).astype(np.uint8))
-        return img
+        return _tensor_to_pil(tensor)
     
-    def pil_to_tensor(self, pil_image):
+    def pil_to_tensor(self, pil_image, out=None):
         """Convert PIL Image to ComfyUI tensor"""
-        img = np.array(pil_image).astype(np.float32) / 255.0
-        return torch.from_numpy(img)[None,]
+        return _pil_to_tensor(pil_image, out)
+    
+    @staticmethod
+    def _input_type_hint(name):
+        """Troubleshooting text appended to input type/shape validation errors"""
+        return "\n".join([
+            "",
+            "",
+            "🚨 数据类型问题:",
+            f"   • 输入的{name}不是有效的图像tensor",
+            "   • 请检查上游节点是否正确输出图像数据",
+            "   • 确保连接的是图像输出端口，而不是其他类型的输出",
+        ])
     
-    def validate_input_data(self, image1, retry_count=0):
+    def validate_input_data(self, images, ready_timeout=0.0):
         """
-        验证输入数据的完整性，支持重试机制处理云端工作流的异步特性
+        验证输入数据的完整性。images: {输入名: tensor}，只校验已连接（非None）的输入。
+        类型/形状错误等待也无法恢复，立即失败；数据质量问题（全零/NaN，云端工作流中上游可能仍在写入）
+        会在 ready_timeout 秒内以指数间隔探测，超时后给出警告并继续执行。
+        返回等待上游就绪所花费的秒数
         """
-        max_retries = 3
-        
-        # 基本验证
-        if image1 is None:
-            if retry_count < max_retries:
-                print(f"输入验证失败 (尝试 {retry_count + 1}/{max_retries + 1}): image1 为 None，等待 {self.retry_delay} 秒后重试...")
-                time.sleep(self.retry_delay)
-                return False, "image1_none"
-            else:
-                raise ValueError("image1 参数是必需的，请确保上游节点已正确连接并执行完成")
-        
-        # 检查tensor类型
-        if not isinstance(image1, torch.Tensor):
-            if retry_count < max_retries:
-                print(f"输入验证失败 (尝试 {retry_count + 1}/{max_retries + 1}): image1 类型错误 {type(image1)}，等待 {self.retry_delay} 秒后重试...")
-                time.sleep(self.retry_delay)
-                return False, "image1_type"
-            else:
-                raise ValueError(f"image1 必须是torch.Tensor类型，当前类型: {type(image1)}")
-        
-        # 检查tensor形状
-        if len(image1.shape) < 3:
-            if retry_count < max_retries:
-                print(f"输入验证失败 (尝试 {retry_count + 1}/{max_retries + 1}): image1 形状无效 {image1.shape}，等待 {self.retry_delay} 秒后重试...")
-                time.sleep(self.retry_delay)
-                return False, "image1_shape"
-            else:
-                raise ValueError(f"image1 tensor形状无效: {image1.shape}，期望至少3维")
-        
-        # 检查tensor数据质量 - 避免全零或无效数据
-        if torch.all(image1 == 0) or torch.isnan(image1).any():
-            if retry_count < max_retries:
-                print(f"输入验证失败 (尝试 {retry_count + 1}/{max_retries + 1}): image1 数据质量问题（全零或包含NaN），等待 {self.retry_delay} 秒后重试...")
-                time.sleep(self.retry_delay)
-                return False, "image1_quality"
-            else:
-                print("警告: image1 包含异常数据，但将继续执行...")
-        
-        print(f"✅ 输入验证通过: image1 形状 {image1.shape}, 数据类型 {image1.dtype}")
-        return True, "success"
+        waited = 0.0
+        for name, image in images.items():
+            if image is None:
+                continue
+            
+            # 检查tensor类型
+            if not isinstance(image, torch.Tensor):
+                raise SeedreamValidationError(
+                    f"{name} 必须是torch.Tensor类型，当前类型: {type(image)}" + self._input_type_hint(name)
+                )
+            
+            # 检查tensor形状
+            if len(image.shape) < 3:
+                raise SeedreamValidationError(
+                    f"{name} tensor形状无效: {image.shape}，期望至少3维" + self._input_type_hint(name)
+                )
+            
+            # 检查tensor数据质量 - 避免全零或无效数据（结果按tensor身份/版本缓存，探测时只重新扫描被改写过的tensor）
+            quality = _input_validator.check_quality(image)
+            if quality != "ok":
+                print(f"输入验证: {name} 数据质量问题（{'全零' if quality == 'all_zero' else '包含NaN'}），最多等待 {ready_timeout - waited:.1f} 秒上游就绪...")
+                ready, elapsed = _wait_until(
+                    lambda: _input_validator.check_quality(image) == "ok",
+                    max(0.0, ready_timeout - waited)
+                )
+                waited += elapsed
+                if ready:
+                    print(f"✅ {name} 已就绪 (等待 {elapsed:.2f} 秒)")
+                else:
+                    print(f"警告: {name} 包含异常数据，但将继续执行...")
+            
+            print(f"✅ 输入验证通过: {name} 形状 {image.shape}, 数据类型 {image.dtype}")
+        return waited
     
-    def convert_image_to_supported_format(self, pil_image, use_local_images=False):
+    def convert_image_to_supported_format(self, pil_image, use_local_images=False,
+                                          upload_codec="png", upload_quality=90, upload_stats=None):
         """
         将本地图像转换为API支持的格式
         根据官方文档：支持Base64编码格式 data:image/<图片格式>;base64,<Base64编码>
+        upload_stats 为列表时，会追加本次编码的格式、字节数与耗时
         """
         try:
             if use_local_images:
                 # 使用官方支持的Base64格式
                 try:
-                    import base64
-                    
-                    # 确保图像是RGB格式
-                    if pil_image.mode != 'RGB':
-                        pil_image = pil_image.convert('RGB')
-                    
-                    # 保存为PNG格式到内存
-                    buffered = io.BytesIO()
-                    pil_image.save(buffered, format="PNG")
-                    img_bytes = buffered.getvalue()
-                    
-                    # 编码为Base64
-                    img_base64 = base64.b64encode(img_bytes).decode('utf-8')
-                    
-                    # 按照官方文档格式：data:image/png;base64,<base64_image>
-                    data_url = f"data:image/png;base64,{img_base64}"
-                    
+                    data_url, stats = _encode_pil_image(pil_image, upload_codec, upload_quality)
+                    if upload_stats is not None:
+                        upload_stats.append(stats)
                     return data_url
                     
                 except Exception as e:
@@ -192,6 +1278,44 @@ class SeedreamImageGenerate:
         except Exception as e:
             return self._get_example_image_url()
     
+    def _encode_input_image(self, img_tensor, model, use_local_images, upload_codec, upload_quality,
+                            downscale_inputs, upload_stats, cache_stats):
+        """
+        将输入tensor转换为上传用的URL。
+        本地Base64模式下按 (tensor内容, 编码设置) 查询编码缓存，命中时跳过转换与编码
+        """
+        # 非批处理模式下只使用第1帧
+        frame = img_tensor[0] if img_tensor.dim() == 4 else img_tensor
+        cache_key = None
+        if use_local_images:
+            pixel_budget = self._get_total_pixel_limits(model)[1] if downscale_inputs else None
+            cache_key = (_tensor_digest(frame), upload_codec, upload_quality, pixel_budget)
+            cached = _encoded_image_cache.get(cache_key)
+            if cached is not None:
+                data_url, stats = cached
+                cache_stats["hits"] += 1
+                upload_stats.append(dict(stats, cached=True))
+                return data_url
+            cache_stats["misses"] += 1
+        
+        # Convert tensor to PIL
+        pil_img = self.tensor_to_pil(frame)
+        original_size = pil_img.size
+        if downscale_inputs:
+            pil_img = self._downscale_to_pixel_budget(pil_img, model)
+        # 转换为API支持的格式
+        stats_count = len(upload_stats)
+        url = self.convert_image_to_supported_format(
+            pil_img, use_local_images, upload_codec, upload_quality, upload_stats
+        )
+        if len(upload_stats) > stats_count:
+            if pil_img.size != original_size:
+                upload_stats[-1]["resized_from"] = original_size
+            # 仅缓存编码成功的结果（失败时会回退到示例图像URL）
+            if cache_key is not None:
+                _encoded_image_cache.put(cache_key, url, dict(upload_stats[-1]))
+        return url
+    
     def _get_example_image_url(self):
         """获取示例图像URL"""
         example_urls = [
@@ -237,86 +1361,286 @@ class SeedreamImageGenerate:
     def _raise_when_no_output_tensor(self):
         return False
     
+    def _get_total_pixel_limits(self, model):
+        return self.MODEL_TOTAL_PIXEL_LIMITS.get(
+            model,
+            (self.MIN_TOTAL_PIXELS, self.MAX_TOTAL_PIXELS, "2560x1440", "4096x4096")
+        )
+    
+    def _downscale_to_pixel_budget(self, pil_image, model):
+        """Shrink a reference image to the model's total pixel limit, keeping the aspect ratio"""
+        max_total_pixels = self._get_total_pixel_limits(model)[1]
+        width, height = pil_image.size
+        if width * height <= max_total_pixels:
+            return pil_image
+        
+        scale = math.sqrt(max_total_pixels / float(width * height))
+        new_size = (max(1, int(width * scale)), max(1, int(height * scale)))
+        return pil_image.resize(new_size, Image.LANCZOS, reducing_gap=3.0)
+    
     def _model_supports_sequential_image_generation(self, model):
         return model != self.SEEDREAM_5_PRO_MODEL
     
     def _model_supports_stream(self, model):
         return model != self.SEEDREAM_5_PRO_MODEL
     
-    def download_image_from_url(self, url):
-        """Download image from URL and convert to tensor"""
-        try:
-            response = requests.get(url)
+    def _fetch_image(self, url, timer=None):
+        """Download and decode one result image into a tensor, recording download/decode/tensor_build spans"""
+        with _span(timer, "download"):
+            response = _get_http_session().get(url, timeout=DOWNLOAD_TIMEOUT)
             response.raise_for_status()
+        with _span(timer, "decode"):
             image = Image.open(io.BytesIO(response.content))
+            image.load()
             if image.mode != 'RGB':
                 image = image.convert('RGB')
+        with _span(timer, "tensor_build"):
             return self.pil_to_tensor(image)
+    
+    def download_image_from_url(self, url, failures=None, timer=None):
+        """Download image from URL and convert to tensor (failed URLs are appended to failures)"""
+        try:
+            return self._fetch_image(url, timer)
         except Exception as e:
+            print(f"⚠️ 图片下载失败，使用占位图: {e}")
+            if failures is not None:
+                failures.append(url)
             # Return a black placeholder image
             placeholder = Image.new('RGB', (512, 512), color='black')
             return self.pil_to_tensor(placeholder)
     
+    def _decode_b64_image(self, b64_data, timer=None):
+        """Decode a b64_json result image into a tensor"""
+        with _span(timer, "decode"):
+            image = _decode_b64_to_pil(b64_data)
+        with _span(timer, "tensor_build"):
+            return self.pil_to_tensor(image)
+    
+    def _materialize_image(self, image_data, response_format, failures=None, timer=None):
+        """Download (url) or decode (b64_json) one result image; returns None when it carries no usable data"""
+        if response_format == "url":
+            url = getattr(image_data, 'url', None)
+            if url and url != 'N/A':
+                return self.download_image_from_url(url, failures, timer)
+            print(f"⚠️ 图像没有有效URL，跳过下载")
+            return None
+        
+        b64_data = getattr(image_data, 'b64_json', None)
+        if b64_data:
+            # 响应对象会保留到节点结束，解码后不再需要 base64 字符串，提前释放
+            try:
+                image_data.b64_json = None
+            except Exception:
+                pass
+            return self._decode_b64_image(b64_data, timer)
+        print(f"⚠️ 图像没有有效的b64_json数据，跳过处理")
+        return None
+    
     def initialize_client(self, base_url):
         """Initialize the Ark client"""
         api_key = os.environ.get("ARK_API_KEY")
         
         if not api_key:
-            raise ValueError("API Key is required. Please set ARK_API_KEY environment variable.")
+            raise SeedreamValidationError("API Key is required. Please set ARK_API_KEY environment variable.")
         
-        self.client = Ark(
-            base_url=base_url,
-            api_key=api_key.strip()
-        )
+        self.client = _get_ark_client(base_url, api_key.strip())
+    
+    def _input_batch_size(self, images):
+        """Return the shared batch size of the IMAGE inputs (inputs with batch 1 are broadcast)"""
+        batch_sizes = {
+            img.shape[0] for img in images
+            if isinstance(img, torch.Tensor) and img.dim() == 4 and img.shape[0] > 1
+        }
+        if len(batch_sizes) > 1:
+            raise SeedreamValidationError(f"批处理模式下各图像输入的batch大小必须一致（或为1），当前为 {sorted(batch_sizes)}")
+        return batch_sizes.pop() if batch_sizes else 1
+    
+    def _select_frame(self, img, index):
+        """Pick frame index of a [B,H,W,C] input as a [1,H,W,C] tensor; batch-1 inputs are broadcast"""
+        if isinstance(img, torch.Tensor) and img.dim() == 4 and img.shape[0] > 1:
+            return img[index:index + 1]
+        return img
+    
+    def _run_fan_out(self, jobs, max_concurrency, requests_per_minute=0):
+        """
+        Run generation jobs (kwargs dicts for _generate_with_retry) concurrently.
+        requests_per_minute > 0 additionally caps how many jobs may start per minute.
+        Returns a list of (result, error, elapsed_seconds) tuples in job order.
+        """
+        budget = _RequestBudget(requests_per_minute) if requests_per_minute > 0 else None
+        
+        def run(job):
+            if budget is not None:
+                budget.acquire()
+            start = time.time()
+            try:
+                return self._generate_with_retry(**job), None, time.time() - start
+            except Exception as e:
+                return None, e, time.time() - start
+        
+        workers = max(1, min(max_concurrency, len(jobs)))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="seedream-fanout") as executor:
+            return list(executor.map(run, jobs))
     
     def generate_images(self, prompt, model, aspect_ratio, sequential_image_generation, 
                        max_images, response_format, watermark, stream, base_url, use_local_images, seed, enable_auto_retry,
-                       image1=None, image2=None, image3=None, image4=None, image5=None):
+                       image1=None, image2=None, image3=None, image4=None, image5=None,
+                       batch_mode=False, prompt_list_mode=False, max_concurrency=4, requests_per_minute=0,
+                       **options):
+        timer = _PhaseTimer(self.__class__.__name__)
+        try:
+            output_tensors, text_output = self._generate_images(
+                prompt, model, aspect_ratio, sequential_image_generation, max_images, response_format,
+                watermark, stream, base_url, use_local_images, seed, enable_auto_retry,
+                image1, image2, image3, image4, image5,
+                batch_mode, prompt_list_mode, max_concurrency, requests_per_minute, timer=timer, **options
+            )
+        except Exception:
+            timer.finish(status="error")
+            raise
+        text_output = "\n".join([text_output, ""] + timer.summary_lines())
+        return (output_tensors, text_output, timer.finish())
+    
+    def _generate_images(self, prompt, model, aspect_ratio, sequential_image_generation,
+                        max_images, response_format, watermark, stream, base_url, use_local_images, seed, enable_auto_retry,
+                        image1, image2, image3, image4, image5,
+                        batch_mode, prompt_list_mode, max_concurrency, requests_per_minute, timer, **options):
+        common = dict(
+            model=model, aspect_ratio=aspect_ratio,
+            sequential_image_generation=sequential_image_generation, max_images=max_images,
+            response_format=response_format, watermark=watermark, stream=stream, base_url=base_url,
+            use_local_images=use_local_images, seed=seed, enable_auto_retry=enable_auto_retry,
+            timer=timer, **options
+        )
+        images = [image1, image2, image3, image4, image5]
+        
+        prompts = [prompt]
+        if prompt_list_mode:
+            prompts = [line.strip() for line in prompt.splitlines() if line.strip()]
+            if not prompts:
+                raise SeedreamValidationError("prompt_list_mode 已开启，但 prompt 中没有非空的提示词行")
+        
+        batch_size = self._input_batch_size(images)
+        frames = list(range(batch_size)) if batch_mode and batch_size > 1 else [None]
+        if batch_size > 1 and not batch_mode:
+            print(f"ℹ️ 输入图像batch大小为 {batch_size}，未启用 batch_mode，仅使用第1帧")
+        
+        if len(prompts) == 1 and frames == [None]:
+            return self._generate_with_retry(
+                prompt=prompts[0], image1=image1, image2=image2, image3=image3, image4=image4, image5=image5,
+                **common
+            )
+        
+        # 扇出模式：每个 (提示词, 帧) 组合作为独立请求并发提交，输出按输入顺序汇总
+        jobs = []
+        labels = []
+        for prompt_index, job_prompt in enumerate(prompts):
+            for frame in frames:
+                frame_images = images if frame is None else [self._select_frame(img, frame) for img in images]
+                label = f"提示词 {prompt_index + 1}" if prompt_list_mode else "请求"
+                if frame is not None:
+                    label += f" / 帧 {frame + 1}"
+                jobs.append(dict(common, prompt=job_prompt, image1=frame_images[0], image2=frame_images[1],
+                                 image3=frame_images[2], image4=frame_images[3], image5=frame_images[4],
+                                 timer=timer.child(job=label)))
+                labels.append(label)
+        
+        mode_parts = []
+        if prompt_list_mode:
+            mode_parts.append(f"{len(prompts)} 条提示词")
+        if frames != [None]:
+            mode_parts.append(f"{batch_size} 帧")
+        rpm_desc = f", 每分钟最多 {requests_per_minute} 个请求" if requests_per_minute > 0 else ""
+        mode_desc = f"📦 扇出模式: {' x '.join(mode_parts)} = {len(jobs)} 个请求, 最大并发 {max_concurrency}{rpm_desc}"
+        print(mode_desc)
+        
+        fan_out_start = time.time()
+        results = self._run_fan_out(jobs, max_concurrency, requests_per_minute)
+        total_elapsed = time.time() - fan_out_start
+        
+        failures = [(i, error) for i, (_, error, _) in enumerate(results) if error is not None]
+        # 提示词列表模式下允许部分失败（在汇总中报告）；批处理模式下任何一帧失败都视为失败
+        if failures and (not prompt_list_mode or len(failures) == len(jobs)):
+            failed_labels = ", ".join(labels[i] for i, _ in failures)
+            raise RuntimeError(
+                f"扇出模式下 {len(failures)}/{len(jobs)} 个请求生成失败 ({failed_labels})\n\n{failures[0][1]}"
+            ) from failures[0][1]
+        
+        output_tensors = []
+        summary = [mode_desc, f"⏳ 总耗时: {total_elapsed:.1f} 秒, 成功 {len(jobs) - len(failures)}/{len(jobs)}", ""]
+        details = []
+        for i, (result, error, elapsed) in enumerate(results):
+            job_prompt = jobs[i]["prompt"]
+            prompt_preview = job_prompt if len(job_prompt) <= 40 else job_prompt[:40] + "..."
+            if error is not None:
+                summary.append(f"❌ [{labels[i]}] 失败 | {elapsed:.1f}s | {prompt_preview}")
+                details.append(f"===== {labels[i]}: 失败 =====")
+                details.append(str(error))
+            else:
+                job_tensors, job_text = result
+                output_tensors.extend(job_tensors)
+                summary.append(f"✅ [{labels[i]}] {len(job_tensors)}张 | {elapsed:.1f}s | {prompt_preview}")
+                details.append(f"===== {labels[i]} =====")
+                details.append(job_text)
+            details.append("")
+        return (output_tensors, "\n".join(summary + [""] + details).rstrip())
+    
+    def _generate_with_retry(self, prompt, model, aspect_ratio, sequential_image_generation, 
+                            max_images, response_format, watermark, stream, base_url, use_local_images, seed, enable_auto_retry,
+                            image1=None, image2=None, image3=None, image4=None, image5=None, **options):
         
         # 根据用户设置决定是否使用重试机制
         max_attempts = self.max_retries + 1 if enable_auto_retry else 1
+        retry_policy = _RetryPolicy(self.retry_delay, self.retry_max_delay, self.retry_budget)
+        
+        # 验证所有已连接的图像输入；启用自动重试时最多等待 input_ready_timeout 秒上游写入完成
+        input_images = {"image1": image1, "image2": image2, "image3": image3, "image4": image4, "image5": image5}
+        ready_timeout = self.input_ready_timeout if enable_auto_retry else 0.0
+        timer = options.get("timer")
+        with _span(timer, "validate"):
+            input_wait_seconds = self.validate_input_data(input_images, ready_timeout)
         
         for retry_count in range(max_attempts):
             try:
-                # 使用智能验证机制验证输入数据（如果image1存在的话）
-                if image1 is not None:
-                    is_valid, error_type = self.validate_input_data(image1, retry_count)
-                    
-                    if not is_valid:
-                        if enable_auto_retry and retry_count < self.max_retries:
-                            # 如果启用重试且还有重试机会，继续下一次循环
-                            continue
-                        else:
-                            # 最终失败，让validate_input_data抛出异常
-                            self.validate_input_data(image1, retry_count)
-                
-                # 验证通过，继续执行
                 if retry_count > 0 and enable_auto_retry:
-                    print(f"✅ 重试成功！开始执行图像生成 (尝试 {retry_count + 1}/{max_attempts})")
-                    print("💡 提示：如果经常需要重试，建议在工作流中添加适当的延迟或确保上游节点完全执行后再触发此节点")
+                    print(f"✅ 开始重试图像生成 (尝试 {retry_count + 1}/{max_attempts})")
                 else:
                     print(f"🚀 开始执行图像生成")
                     
                 return self._execute_generation(prompt, model, aspect_ratio, sequential_image_generation, 
                                               max_images, response_format, watermark, stream, base_url, use_local_images, seed, enable_auto_retry,
-                                              image1, image2, image3, image4, image5)
+                                              image1, image2, image3, image4, image5,
+                                              input_wait_seconds=input_wait_seconds, **options)
                 
             except Exception as e:
+                category = _RetryPolicy.classify(e)
+                delay = None
                 if enable_auto_retry and retry_count < self.max_retries:
-                    print(f"执行失败 (尝试 {retry_count + 1}/{max_attempts}): {str(e)}")
-                    print(f"等待 {self.retry_delay} 秒后重试...")
-                    time.sleep(self.retry_delay)
-                    continue
-                else:
-                    # 最后一次重试也失败了，或者没有启用重试，抛出异常
+                    delay = retry_policy.next_delay(category, retry_count, e)
+                if delay is None:
+                    # 不可重试的错误（参数/鉴权）、重试次数或等待预算用尽，或者没有启用重试，抛出异常
+                    if enable_auto_retry and category not in _RetryPolicy.RETRYABLE_CATEGORIES:
+                        print(f"执行失败 (类型: {category})，该错误不可重试，立即失败")
                     raise e
+                print(f"执行失败 (尝试 {retry_count + 1}/{max_attempts}, 类型: {category}): {str(e)}")
+                if category == "rate_limit":
+                    # 触发限流时让共享同一 (base_url, model) 的所有请求一起暂停，避免各自重试形成重试风暴
+                    _get_api_governor(base_url, model).pause(delay)
+                print(f"等待 {delay:.2f} 秒后重试...")
+                with _span(timer, "retry_wait", category=category):
+                    time.sleep(delay)
+                continue
     
     def _execute_generation(self, prompt, model, aspect_ratio, sequential_image_generation, 
                            max_images, response_format, watermark, stream, base_url, use_local_images, seed, enable_auto_retry,
-                           image1=None, image2=None, image3=None, image4=None, image5=None):
+                           image1=None, image2=None, image3=None, image4=None, image5=None,
+                           upload_codec="png", upload_quality=90, downscale_inputs=False,
+                           enable_result_cache=False, result_cache_ttl_hours=24, input_wait_seconds=0.0,
+                           timer=None):
         """
         实际执行图像生成的核心逻辑
         """
+        api_slot = None
         try:
             
             # 标准化seed参数 - 将大的seed值映射到有效范围内
@@ -327,7 +1651,8 @@ class SeedreamImageGenerate:
                 print(f"原始seed值 {seed} 被标准化为 {normalized_seed}")
             
             # Initialize client
-            self.initialize_client(base_url)
+            with _span(timer, "client_init"):
+                self.initialize_client(base_url)
             
             # Note: normalized_seed parameter is available for workflow tracking but not sent to the API
             # The Volcengine Seedream API doesn't currently support seed parameter
@@ -347,13 +1672,20 @@ class SeedreamImageGenerate:
             
             # Convert input images to URLs
             image_urls = []
+            upload_stats = []
+            
+            cache_stats = {"hits": 0, "misses": 0}
             
             for i, img_tensor in enumerate(input_images):
-                # Convert tensor to PIL
-                pil_img = self.tensor_to_pil(img_tensor.squeeze(0))
-                # 转换为API支持的格式
-                url = self.convert_image_to_supported_format(pil_img, use_local_images)
+                with _span(timer, "encode", input=i + 1):
+                    url = self._encode_input_image(
+                        img_tensor, model, use_local_images, upload_codec, upload_quality,
+                        downscale_inputs, upload_stats, cache_stats
+                    )
                 image_urls.append(url)
+            if upload_stats:
+                for line in _format_upload_stats(upload_stats, cache_stats):
+                    print(line)
                 
             # Convert size input to API size parameter
             size = self._resolve_size(aspect_ratio, model)
@@ -374,7 +1706,7 @@ class SeedreamImageGenerate:
             if supports_sequential_image_generation:
                 # 使用SDK的SequentialImageGenerationOptions类
                 # 对应官方API: {"max_images": int}
-                generation_options = SequentialImageGenerationOptions(max_images=max_images)
+                generation_options = _import_ark().SequentialImageGenerationOptions(max_images=max_images)
                 generate_params["sequential_image_generation"] = sequential_image_generation
                 generate_params["sequential_image_generation_options"] = generation_options
                 print(f"🔄 顺序生成选项: max_images={max_images}")
@@ -414,18 +1746,50 @@ class SeedreamImageGenerate:
                 generate_params.update(extra_params)
                 print(f"   - 额外参数: {list(extra_params.keys())}")
             
-            images_response = self.client.images.generate(**generate_params)
+            result_cache_ttl = result_cache_ttl_hours * 3600
+            result_cache_key = None
+            cached_result = None
+            if enable_result_cache:
+                result_cache_key = _result_cache.make_key(generate_params, normalized_seed)
+                with _span(timer, "result_cache_lookup"):
+                    cached_result = _result_cache.load(result_cache_key, result_cache_ttl)
+            
+            if cached_result is None:
+                # 全局限流：与其他节点共享 (base_url, model) 的请求速率与在途名额，流式响应读完后才释放
+                api_slot = _get_api_governor(base_url, model).acquire(timer)
+            request_start = time.perf_counter()
+            if cached_result is None:
+                images_response = self.client.images.generate(**generate_params)
+            else:
+                images_response = None
             
             # 处理流式响应
             all_image_data = []
+            image_futures = []
+            download_failures = []
             event_count = 0  # 在外部初始化，用于错误报告
-            if effective_stream:
-                print(f"🌊 流式响应模式，正在收集所有图片...")
+            fetch_executor = _get_image_fetch_executor()
+            
+            def collect_image(image_data):
+                # 收到图片后立即提交下载/解码，与后续图片的生成并行
+                all_image_data.append(image_data)
+                image_timer = timer.child(image=len(all_image_data)) if timer is not None else None
+                image_futures.append(fetch_executor.submit(
+                    self._materialize_image, image_data, response_format, download_failures, image_timer
+                ))
+            
+            if cached_result is not None:
+                print(f"🗄️ 命中结果缓存 {result_cache_key[:16]}，跳过API请求")
+                all_image_data = cached_result[1]
+            elif effective_stream:
+                print(f"🌊 流式响应模式，每收到一张图片立即开始下载/解码...")
                 try:
                     # 根据官方示例，流式响应返回的是event对象迭代器
                     # event有type属性来区分不同的事件类型
                     for event in images_response:
                         event_count += 1
+                        if event_count == 1 and timer is not None:
+                            timer.add("first_event", request_start)
                         
                         # 跳过None事件
                         if event is None:
@@ -451,13 +1815,13 @@ class SeedreamImageGenerate:
                                 if hasattr(event, 'error') and event.error is None:
                                     if hasattr(event, 'url') and event.url:
                                         # 收集图片URL
-                                        all_image_data.append(event)
+                                        collect_image(event)
                                         size_info = getattr(event, 'size', 'unknown')
                                         url_preview = event.url[:60] + '...' if len(event.url) > 60 else event.url
                                         print(f"   ✅ 收到第 {len(all_image_data)} 张图片成功: Size={size_info}, URL={url_preview}")
                                     elif hasattr(event, 'b64_json') and event.b64_json:
                                         # Base64格式
-                                        all_image_data.append(event)
+                                        collect_image(event)
                                         print(f"   ✅ 收到第 {len(all_image_data)} 张图片成功 (Base64格式)")
                             
                             elif event.type == "image_generation.completed":
@@ -469,7 +1833,7 @@ class SeedreamImageGenerate:
                             print(f"   ⚠️ Event没有type属性，尝试作为图片数据处理")
                             # 兼容旧格式：可能是直接的图片数据
                             if hasattr(event, 'url') and event.url:
-                                all_image_data.append(event)
+                                collect_image(event)
                                 print(f"   ✅ 直接收集event为图片: {len(all_image_data)}")
                     
                     print(f"📊 流式响应完成，共收到 {event_count} 个event，收集 {len(all_image_data)} 张有效图片")
@@ -489,11 +1853,17 @@ class SeedreamImageGenerate:
                         has_url = hasattr(img_data, 'url') and img_data.url is not None
                         has_b64 = hasattr(img_data, 'b64_json') and img_data.b64_json is not None
                         if has_url or has_b64:
-                            all_image_data.append(img_data)
+                            collect_image(img_data)
                     print(f"📊 非流式响应，返回 {len(all_image_data)} 张有效图片")
                 else:
                     print(f"⚠️ 响应没有data属性")
             
+            if api_slot is not None:
+                api_slot.release()
+            if cached_result is None and timer is not None:
+                # 流式模式下包含等待全部事件的时间
+                timer.add("request", request_start, stream=effective_stream)
+            
             if not all_image_data:
                 error_detail = f"API未返回任何图片数据\n"
                 error_detail += f"  - stream模式: {effective_stream}\n"
@@ -510,6 +1880,9 @@ class SeedreamImageGenerate:
             # Process generated images and collect information
             output_tensors = []
             result_info = []
+            if cached_result is not None:
+                with _span(timer, "tensor_build", source="result_cache"):
+                    output_tensors = _pil_batch_to_tensor(cached_result[0])
             
             # Collect basic generation info
             result_info.append(f"🎨 生成信息:")
@@ -525,8 +1898,12 @@ class SeedreamImageGenerate:
             input_image_count = len([img for img in [image1, image2, image3, image4, image5] if img is not None])
             result_info.append(f"📊 输入图像: {input_image_count}张" + (" (文生图模式)" if input_image_count == 0 else " (图生图模式)"))
             result_info.append(f"🔄 本地图像模式: {'Base64编码' if use_local_images else '示例图像'}")
+            if upload_stats:
+                result_info.extend(_format_upload_stats(upload_stats, cache_stats))
             result_info.append(f"🎲 种子值: {normalized_seed}" + (f" (原始: {seed})" if seed != normalized_seed else ""))
             result_info.append(f"⚡ 执行状态: 成功 (自动重试: {'启用' if enable_auto_retry else '禁用'})")
+            if input_wait_seconds > 0:
+                result_info.append(f"⏱️ 输入就绪等待: {input_wait_seconds:.2f} 秒")
             result_info.append("")
             
             for i, image_data in enumerate(all_image_data):
@@ -546,29 +1923,17 @@ class SeedreamImageGenerate:
                 if hasattr(image_data, 'finish_reason') and image_data.finish_reason:
                     result_info.append(f"   ✅ 完成原因: {image_data.finish_reason}")
                 
-                if response_format == "url":
-                    # Download image from URL
-                    if url and url != 'N/A':
-                        tensor = self.download_image_from_url(url)
-                        output_tensors.append(tensor)
-                    else:
-                        print(f"⚠️ 图像 {i+1} 没有有效URL，跳过下载")
-                else:  # b64_json
-                    # Handle base64 encoded image
-                    if hasattr(image_data, 'b64_json') and image_data.b64_json:
-                        import base64
-                        image_data_b64 = image_data.b64_json
-                        image_bytes = base64.b64decode(image_data_b64)
-                        image = Image.open(io.BytesIO(image_bytes))
-                        if image.mode != 'RGB':
-                            image = image.convert('RGB')
-                        tensor = self.pil_to_tensor(image)
-                        output_tensors.append(tensor)
-                    else:
-                        print(f"⚠️ 图像 {i+1} 没有有效的b64_json数据，跳过处理")
-                
                 result_info.append("")
             
+            if image_futures:
+                # 流式模式下大部分图片已在生成过程中处理完毕，这里只等待剩余部分
+                print(f"⬇️ 等待 {len(image_futures)} 张图片下载/解码完成 (并发数 {MAX_DOWNLOAD_WORKERS})")
+                fetch_start = time.time()
+                with _span(timer, "fetch_wait"):
+                    fetched = [future.result() for future in image_futures]
+                output_tensors.extend(tensor for tensor in fetched if tensor is not None)
+                print(f"✅ 图片处理完成，额外等待 {time.time() - fetch_start:.2f} 秒")
+            
             # Add generation parameters info
             result_info.append("⚙️ 生成参数:")
             result_info.append(f"   🎯 响应格式: {response_format}")
@@ -576,6 +1941,21 @@ class SeedreamImageGenerate:
             result_info.append(f"   🌊 流式传输: {'是' if effective_stream else '否'}" + (" (当前模型不支持，已忽略)" if stream and not supports_stream else ""))
             result_info.append(f"   🌐 API地址: {base_url}")
             
+            if enable_result_cache:
+                if cached_result is not None:
+                    result_info.append(f"   🗄️ 结果缓存: 命中 ({result_cache_key[:16]})")
+                elif output_tensors and len(output_tensors) == len(all_image_data) and not download_failures:
+                    try:
+                        with _span(timer, "result_cache_store"):
+                            pil_images = [image for tensor in output_tensors for image in _tensor_batch_to_pil(tensor)]
+                            _result_cache.store(result_cache_key, pil_images, all_image_data, result_cache_ttl)
+                        result_info.append(f"   🗄️ 结果缓存: 未命中，已写入 ({result_cache_key[:16]})")
+                    except Exception as cache_error:
+                        print(f"⚠️ 写入结果缓存失败: {cache_error}")
+                        result_info.append("   🗄️ 结果缓存: 未命中，写入失败")
+                else:
+                    result_info.append("   🗄️ 结果缓存: 未命中，存在下载失败的图片，未写入")
+            
             if not output_tensors:
                 if self._raise_when_no_output_tensor():
                     raise ValueError("图片生成失败：API 返回了图片数据，但未能解析或下载出有效图像")
@@ -618,14 +1998,6 @@ class SeedreamImageGenerate:
                     "   • 如果使用API调用，请确保所有依赖节点按正确顺序执行",
                     ""
                 ])
-            elif "torch.Tensor" in error_msg:
-                error_text_parts.extend([
-                    "🚨 数据类型问题:",
-                    "   • 输入的image1不是有效的图像tensor",
-                    "   • 请检查上游节点是否正确输出图像数据",
-                    "   • 确保连接的是图像输出端口，而不是其他类型的输出",
-                    ""
-                ])
             elif "Invalid image file" in error_msg:
                 error_text_parts.extend([
                     "🚨 图像文件问题:",
@@ -698,24 +2070,19 @@ class SeedreamImageGenerate:
                 print(f"  image1 形状: {getattr(image1, 'shape', 'N/A')}")
             
             # 抛出异常让ComfyUI显示报错弹窗，不输出红图
-            raise RuntimeError(error_text)
+            raise RuntimeError(error_text) from e
+        finally:
+            if api_slot is not None:
+                api_slot.release()
 
 class SeedreamImageGenerateV2(SeedreamImageGenerate):
     """
     Seedream image generation node using direct resolution input.
     """
     
-    MIN_TOTAL_PIXELS = 2560 * 1440
-    MAX_TOTAL_PIXELS = 4096 * 4096
     MIN_ASPECT_RATIO = 1 / 16
     MAX_ASPECT_RATIO = 16
     MAX_DIMENSION = 16384
-    MODEL_TOTAL_PIXEL_LIMITS = {
-        "doubao-seedream-5-0-pro-260628": ((1280 * 720), (2048 * 2048), "1280x720", "2048x2048"),
-        "doubao-seedream-5-0-260128": ((2560 * 1440), (4096 * 4096), "2560x1440", "4096x4096"),
-        "doubao-seedream-4-5-251128": ((2560 * 1440), (4096 * 4096), "2560x1440", "4096x4096"),
-        "doubao-seedream-4-0-250828": ((1280 * 720), (4096 * 4096), "1280x720", "4096x4096"),
-    }
     
     @classmethod
     def INPUT_TYPES(cls):
@@ -787,7 +2154,8 @@ class SeedreamImageGenerateV2(SeedreamImageGenerate):
                 "image2": ("IMAGE",),
                 "image3": ("IMAGE",),
                 "image4": ("IMAGE",),
-                "image5": ("IMAGE",)
+                "image5": ("IMAGE",),
+                **cls._extra_optional_inputs()
             }
         }
     
@@ -799,27 +2167,21 @@ class SeedreamImageGenerateV2(SeedreamImageGenerate):
     def _raise_when_no_output_tensor(self):
         return True
     
-    def _get_total_pixel_limits(self, model):
-        return self.MODEL_TOTAL_PIXEL_LIMITS.get(
-            model,
-            (self.MIN_TOTAL_PIXELS, self.MAX_TOTAL_PIXELS, "2560x1440", "4096x4096")
-        )
-    
     def _resolve_size(self, resolution, model=None):
         normalized = str(resolution).strip()
         match = re.fullmatch(r"(\d+)\s*[xX×]\s*(\d+)", normalized)
         if not match:
-            raise ValueError("resolution格式无效，内部组合值应为 1280x720 或 2048x2048 这样的 宽x高 格式")
+            raise SeedreamValidationError("resolution格式无效，内部组合值应为 1280x720 或 2048x2048 这样的 宽x高 格式")
         
         width = int(match.group(1))
         height = int(match.group(2))
         if width <= 0 or height <= 0:
-            raise ValueError(f"resolution尺寸必须为正整数，当前为 {width}x{height}")
+            raise SeedreamValidationError(f"resolution尺寸必须为正整数，当前为 {width}x{height}")
         
         min_total_pixels, max_total_pixels, min_label, max_label = self._get_total_pixel_limits(model)
         total_pixels = width * height
         if total_pixels < min_total_pixels or total_pixels > max_total_pixels:
-            raise ValueError(
+            raise SeedreamValidationError(
                 f"模型 {model or '未知'} 的 resolution 总像素需在 {min_total_pixels} ({min_label}) "
                 f"到 {max_total_pixels} ({max_label}) 之间，"
                 f"当前 {width}x{height}={total_pixels}"
@@ -827,20 +2189,15 @@ class SeedreamImageGenerateV2(SeedreamImageGenerate):
         
         aspect_ratio = width / height
         if aspect_ratio < self.MIN_ASPECT_RATIO or aspect_ratio > self.MAX_ASPECT_RATIO:
-            raise ValueError(
+            raise SeedreamValidationError(
                 f"resolution宽高比需在 1/16 到 16 之间，当前 {width}:{height}={aspect_ratio:.4f}"
             )
         
         return f"{width}x{height}"
     
-    def download_image_from_url(self, url):
+    def download_image_from_url(self, url, failures=None, timer=None):
         try:
-            response = requests.get(url)
-            response.raise_for_status()
-            image = Image.open(io.BytesIO(response.content))
-            if image.mode != 'RGB':
-                image = image.convert('RGB')
-            return self.pil_to_tensor(image)
+            return self._fetch_image(url, timer)
         except Exception as e:
             raise ValueError(f"图片生成失败：无法下载或解析生成图片 {url}: {e}") from e
     
@@ -848,13 +2205,13 @@ class SeedreamImageGenerateV2(SeedreamImageGenerate):
                            sequential_image_generation, max_images, response_format,
                            watermark, stream, base_url, use_local_images, seed,
                            enable_auto_retry,
-                           image1=None, image2=None, image3=None, image4=None, image5=None):
+                           image1=None, image2=None, image3=None, image4=None, image5=None, **options):
         resolution = f"{width}x{height}"
         return super().generate_images(
             prompt, model, resolution,
             sequential_image_generation, max_images, response_format,
             watermark, stream, base_url, use_local_images, seed, enable_auto_retry,
-            image1, image2, image3, image4, image5
+            image1, image2, image3, image4, image5, **options
         )
 
 class SeedreamImageGenerateWithWebSearch(SeedreamImageGenerate):
@@ -923,7 +2280,8 @@ class SeedreamImageGenerateWithWebSearch(SeedreamImageGenerate):
                 "image2": ("IMAGE",),
                 "image3": ("IMAGE",),
                 "image4": ("IMAGE",),
-                "image5": ("IMAGE",)
+                "image5": ("IMAGE",),
+                **cls._extra_optional_inputs()
             }
         }
     
@@ -933,25 +2291,146 @@ class SeedreamImageGenerateWithWebSearch(SeedreamImageGenerate):
                                         sequential_image_generation, max_images, response_format,
                                         watermark, stream, base_url, use_local_images, seed,
                                         enable_auto_retry,
-                                        image1=None, image2=None, image3=None, image4=None, image5=None):
+                                        image1=None, image2=None, image3=None, image4=None, image5=None, **options):
         self._enable_web_search = enable_web_search
         return super().generate_images(
             prompt, "doubao-seedream-5-0-260128", aspect_ratio,
             sequential_image_generation, max_images, response_format,
             watermark, stream, base_url, use_local_images, seed, enable_auto_retry,
-            image1, image2, image3, image4, image5
+            image1, image2, image3, image4, image5, **options
         )
     
     def _get_additional_generate_params(self):
         if getattr(self, '_enable_web_search', False):
-            return {"tools": [ContentGenerationTool(type="web_search")]}
+            return {"tools": [_import_ark().ContentGenerationTool(type="web_search")]}
         return {}
 
 
+# Seedance 任务轮询：同一事件循环内的所有视频任务共享一个轮询协程
+SEEDANCE_POLL_INITIAL_INTERVAL = 1.0  # 秒，首次轮询间隔
+SEEDANCE_POLL_BACKOFF = 1.5  # 每次轮询后间隔的放大倍数，直到 poll_interval 上限
+SEEDANCE_TERMINAL_STATUSES = ("succeeded", "failed", "cancelled", "expired")
+
+# 生成视频下载到 ComfyUI 临时目录：大块流式写入，断线后按 Range 续传，大文件分段并行
+VIDEO_DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+VIDEO_DOWNLOAD_MAX_RESUMES = 3  # 每段连接中断后最多续传次数
+VIDEO_DOWNLOAD_SEGMENTS = 4  # 并行分段数
+VIDEO_DOWNLOAD_SEGMENT_MIN_BYTES = 16 * 1024 * 1024  # 小于该大小的文件不分段
+
+
+class _SeedanceTaskTracker:
+    """
+    Tracks Seedance tasks for one asyncio event loop.
+    Each task has its own adaptive interval (fast at first, then backing off to its ceiling);
+    all tasks that are due are fetched together, so several video nodes overlap their waits.
+    """
+    
+    def __init__(self):
+        self._tasks = {}
+        self._wakeup = asyncio.Event()
+        self._runner = None
+    
+    async def wait(self, client, task_id, max_interval, max_wait_time, governor=None):
+        """
+        Wait until task_id reaches a terminal status and return the last task result.
+        Each status query takes a slot from governor when given.
+        """
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        entry = {
+            "client": client,
+            "governor": governor,
+            "future": loop.create_future(),
+            "interval": min(SEEDANCE_POLL_INITIAL_INTERVAL, max_interval),
+            "max_interval": max_interval,
+            "next_poll": now,
+            "deadline": now + max_wait_time,
+            "max_wait_time": max_wait_time,
+            "last_status": None,
+        }
+        self._tasks[task_id] = entry
+        if self._runner is None or self._runner.done():
+            self._runner = loop.create_task(self._run())
+        self._wakeup.set()
+        try:
+            return await entry["future"]
+        finally:
+            self._tasks.pop(task_id, None)
+    
+    @staticmethod
+    def _get_task(entry, task_id):
+        if entry["governor"] is None:
+            return entry["client"].content_generation.tasks.get(task_id=task_id)
+        with entry["governor"].slot():
+            return entry["client"].content_generation.tasks.get(task_id=task_id)
+    
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            active = {task_id: entry for task_id, entry in self._tasks.items() if not entry["future"].done()}
+            if not active:
+                break
+            
+            now = loop.time()
+            due = [(task_id, entry) for task_id, entry in active.items() if entry["next_poll"] <= now]
+            if due:
+                results = await asyncio.gather(
+                    *(asyncio.to_thread(self._get_task, entry, task_id) for task_id, entry in due),
+                    return_exceptions=True
+                )
+                now = loop.time()
+                for (task_id, entry), result in zip(due, results):
+                    if entry["future"].done():
+                        continue
+                    if isinstance(result, Exception):
+                        category = _RetryPolicy.classify(result)
+                        if category not in _RetryPolicy.RETRYABLE_CATEGORIES:
+                            entry["future"].set_exception(result)
+                            continue
+                        print(f"   ⚠️ 查询任务 {task_id} 状态失败 ({category})，稍后重试: {result}")
+                    elif result.status in SEEDANCE_TERMINAL_STATUSES:
+                        entry["future"].set_result(result)
+                        continue
+                    else:
+                        entry["last_status"] = result.status
+                    
+                    if now >= entry["deadline"]:
+                        entry["future"].set_exception(TimeoutError(
+                            f"视频生成超时 (任务ID: {task_id})，已等待 {entry['max_wait_time']}秒，"
+                            f"可增大 max_wait_time 参数后重试"
+                        ))
+                        continue
+                    entry["next_poll"] = min(now + entry["interval"], entry["deadline"])
+                    print(f"   任务 {task_id} 当前状态: {entry['last_status']}，{entry['interval']:.1f}秒后再次查询")
+                    entry["interval"] = min(entry["max_interval"], entry["interval"] * SEEDANCE_POLL_BACKOFF)
+                continue
+            
+            next_poll = min(entry["next_poll"] for entry in active.values())
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=max(0.0, next_poll - now))
+            except asyncio.TimeoutError:
+                pass
+
+
+_seedance_trackers = weakref.WeakKeyDictionary()
+
+
+def _get_seedance_task_tracker():
+    """Return the task tracker bound to the running event loop"""
+    loop = asyncio.get_running_loop()
+    tracker = _seedance_trackers.get(loop)
+    if tracker is None:
+        tracker = _SeedanceTaskTracker()
+        _seedance_trackers[loop] = tracker
+    return tracker
+
+
 class SeedanceVideoGenerate:
     """
     A ComfyUI node for generating videos using Volcengine Seedance API.
-    Uses async task creation + polling workflow.
+    Uses async task creation + polling workflow; generate_video is a coroutine so the
+    ComfyUI worker is released while the task runs.
     """
     
     @classmethod
@@ -985,7 +2464,7 @@ class SeedanceVideoGenerate:
                     "min": 1,
                     "max": 30,
                     "step": 1,
-                    "tooltip": "任务状态轮询间隔（秒）"
+                    "tooltip": "任务状态轮询间隔上限（秒）。轮询从1秒开始逐步放大到该值，等待期间不占用执行线程"
                 }),
                 "max_wait_time": ("INT", {
                     "default": 600,
@@ -1004,11 +2483,26 @@ class SeedanceVideoGenerate:
                     "tooltip": "参考视频公网 URL。当前按官方要求仅建议使用 .mp4 / .mov 的可访问 web url"
                 }),
                 "audio": ("AUDIO", {"tooltip": "可选音频输入，用于为视频添加音频驱动；可连接 ComfyUI 的 LoadAudio / GetVideoComponents 等节点输出"}),
+                "upload_codec": (UPLOAD_CODECS, {
+                    "default": "png",
+                    "tooltip": "输入图片上传编码：png=无损；jpeg/webp=有损，体积更小、编码更快；auto=按 upload_quality 选择体积最小的有损编码"
+                }),
+                "upload_quality": ("INT", {
+                    "default": 90,
+                    "min": 50,
+                    "max": 100,
+                    "step": 1,
+                    "tooltip": "jpeg/webp/auto 编码质量"
+                }),
+                "download_video": ("BOOLEAN", {
+                    "default": False,
+                    "tooltip": "生成成功后下载视频到 ComfyUI 临时目录，并通过 video_path 输出本地路径（大文件分段并行下载，断线自动续传）"
+                }),
             }
         }
     
-    RETURN_TYPES = ("STRING", "STRING")
-    RETURN_NAMES = ("video_url", "text")
+    RETURN_TYPES = ("STRING", "STRING", "STRING", "STRING")
+    RETURN_NAMES = ("video_url", "text", "video_path", "metrics")
     FUNCTION = "generate_video"
     CATEGORY = "video/generation"
     
@@ -1018,22 +2512,17 @@ class SeedanceVideoGenerate:
     def initialize_client(self, base_url):
         api_key = os.environ.get("ARK_API_KEY")
         if not api_key:
-            raise ValueError("API Key is required. Please set ARK_API_KEY environment variable.")
-        self.client = Ark(base_url=base_url, api_key=api_key.strip())
+            raise SeedreamValidationError("API Key is required. Please set ARK_API_KEY environment variable.")
+        self.client = _get_ark_client(base_url, api_key.strip())
     
     def tensor_to_pil(self, tensor):
-        i = 255. * tensor.cpu().numpy()
-        img = Image.fromarray(np.clip(i, 0, 255).astype(np.uint8))
-        return img
+        return _tensor_to_pil(tensor)
     
-    def image_to_base64_url(self, pil_image):
-        import base64
-        if pil_image.mode != 'RGB':
-            pil_image = pil_image.convert('RGB')
-        buffered = io.BytesIO()
-        pil_image.save(buffered, format="PNG")
-        img_base64 = base64.b64encode(buffered.getvalue()).decode('utf-8')
-        return f"data:image/png;base64,{img_base64}"
+    def image_to_base64_url(self, pil_image, upload_codec="png", upload_quality=90, upload_stats=None):
+        data_url, stats = _encode_pil_image(pil_image, upload_codec, upload_quality)
+        if upload_stats is not None:
+            upload_stats.append(stats)
+        return data_url
     
     def file_to_base64_url(self, file_path, media_type):
         """Convert a local file to a base64 data URL. media_type example: 'video/mp4', 'audio/wav'"""
@@ -1140,6 +2629,7 @@ class SeedanceVideoGenerate:
         duration_seconds, estimated_wav_mb = self._validate_audio_constraints(waveform, sample_rate)
         pcm16 = (waveform.numpy().T * 32767.0).astype(np.int16)
 
+        import wave
         buffer = io.BytesIO()
         with wave.open(buffer, "wb") as wav_file:
             wav_file.setnchannels(pcm16.shape[1] if pcm16.ndim == 2 else 1)
@@ -1181,45 +2671,152 @@ class SeedanceVideoGenerate:
             meta['total_tokens'] = getattr(usage, 'total_tokens', None)
         return meta
     
-    def _download_video(self, video_url, task_id):
-        """Download video from URL to ComfyUI temp directory for pipeline passthrough"""
+    def _download_range(self, session, video_url, file_path, start, end):
+        """
+        Write bytes [start, end] of video_url into file_path at the same offsets.
+        end=None means to the end of the resource. Dropped connections resume from the
+        last written byte with a Range request, up to VIDEO_DOWNLOAD_MAX_RESUMES times.
+        Returns the number of bytes written.
+        """
+        import requests
+        position = start
+        resumes = 0
+        with open(file_path, "r+b") as f:
+            while end is None or position <= end:
+                ranged = position > 0 or end is not None
+                headers = {"Range": f"bytes={position}-{'' if end is None else end}"} if ranged else {}
+                try:
+                    with session.get(video_url, headers=headers, stream=True, timeout=DOWNLOAD_TIMEOUT) as response:
+                        response.raise_for_status()
+                        if ranged and response.status_code != 206:
+                            if start != 0 or end is not None:
+                                raise RuntimeError("服务器不支持 Range 请求，无法分段下载")
+                            # 服务器忽略了 Range，只能从头重新下载
+                            position = 0
+                            f.truncate(0)
+                        f.seek(position)
+                        for chunk in response.iter_content(chunk_size=VIDEO_DOWNLOAD_CHUNK_SIZE):
+                            if end is not None:
+                                chunk = chunk[:end + 1 - position]
+                            f.write(chunk)
+                            position += len(chunk)
+                    break
+                except (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError,
+                        requests.exceptions.Timeout) as e:
+                    resumes += 1
+                    if resumes > VIDEO_DOWNLOAD_MAX_RESUMES:
+                        raise
+                    print(f"⚠️ 下载中断，从第 {position} 字节续传 ({resumes}/{VIDEO_DOWNLOAD_MAX_RESUMES}): {e}")
+        return position - start
+
+    def _probe_video_size(self, session, video_url):
+        """
+        Return (total_size, accepts_ranges) for video_url, 0 when unknown.
+        Ark returns presigned TOS GET URLs whose signature covers the HTTP method, so HEAD
+        is rejected; probe with a one-byte ranged GET and read the size from Content-Range.
+        """
+        with session.get(video_url, headers={"Range": "bytes=0-0"}, stream=True, timeout=DOWNLOAD_TIMEOUT) as response:
+            if not response.ok:
+                return 0, False
+            if response.status_code == 206:
+                # Content-Range: bytes 0-0/<total>
+                total = response.headers.get("content-range", "").rpartition("/")[2]
+                return (int(total), True) if total.isdigit() else (0, False)
+            # 服务器忽略了 Range，返回完整内容：不读取响应体，只取大小
+            return int(response.headers.get("content-length", 0) or 0), False
+
+    def _download_video(self, video_url, task_id, parallel_segments=True):
+        """
+        Download the generated video into the ComfyUI temp directory and return its path.
+        The file is written to a .part sibling and atomically renamed once complete.
+        """
+        import requests
         temp_dir = folder_paths.get_temp_directory()
+        os.makedirs(temp_dir, exist_ok=True)
         filename = f"seedance_{task_id}_{int(time.time())}.mp4"
         file_path = os.path.join(temp_dir, filename)
-        
+        part_path = file_path + ".part"
+        session = _get_http_session()
+        start_time = time.time()
+
         print(f"📥 正在下载视频: {video_url[:80]}...")
-        response = requests.get(video_url, stream=True)
-        response.raise_for_status()
-        
-        total_size = int(response.headers.get('content-length', 0))
-        downloaded = 0
-        
-        with open(file_path, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                f.write(chunk)
-                downloaded += len(chunk)
-                if total_size > 0 and (downloaded * 100 // total_size) % 20 == 0:
-                    print(f"   下载进度: {downloaded * 100 // total_size}%")
-        
-        file_size_mb = os.path.getsize(file_path) / (1024 * 1024)
-        print(f"✅ 视频已下载到临时目录: {file_path} ({file_size_mb:.1f} MB)")
+        total_size = 0
+        accepts_ranges = False
+        try:
+            total_size, accepts_ranges = self._probe_video_size(session, video_url)
+        except requests.exceptions.RequestException as e:
+            print(f"⚠️ 获取视频大小失败，改为单连接下载: {e}")
+
+        segments = VIDEO_DOWNLOAD_SEGMENTS if (
+            parallel_segments and accepts_ranges and total_size >= VIDEO_DOWNLOAD_SEGMENT_MIN_BYTES
+        ) else 1
+
+        try:
+            with open(part_path, "wb") as f:
+                if segments > 1:
+                    f.truncate(total_size)
+
+            if segments > 1:
+                segment_size = math.ceil(total_size / segments)
+                ranges = [(i, min(i + segment_size, total_size) - 1) for i in range(0, total_size, segment_size)]
+                with ThreadPoolExecutor(max_workers=len(ranges), thread_name_prefix="video-download") as executor:
+                    futures = [
+                        executor.submit(self._download_range, session, video_url, part_path, start, end)
+                        for start, end in ranges
+                    ]
+                    downloaded = sum(future.result() for future in futures)
+            else:
+                downloaded = self._download_range(session, video_url, part_path, 0, None)
+
+            if total_size and downloaded != total_size:
+                raise RuntimeError(f"视频下载不完整: {downloaded}/{total_size} 字节")
+            os.replace(part_path, file_path)
+        except Exception:
+            try:
+                os.remove(part_path)
+            except OSError:
+                pass
+            raise
+
+        file_size_mb = downloaded / (1024 * 1024)
+        elapsed = max(time.time() - start_time, 1e-6)
+        print(f"✅ 视频已下载到临时目录: {file_path} ({file_size_mb:.1f} MB, "
+              f"{file_size_mb / elapsed:.1f} MB/s, {segments} 段)")
         return file_path
+
+    async def generate_video(self, prompt, model, duration, watermark, base_url,
+                       poll_interval, max_wait_time, image=None, video=None, video_url="", audio=None,
+                       upload_codec="png", upload_quality=90, download_video=False):
+        timer = _PhaseTimer(self.__class__.__name__)
+        try:
+            video_url, text_output, video_file_path = await self._generate_video(
+                prompt, model, duration, watermark, base_url, poll_interval, max_wait_time,
+                image, video, video_url, audio, upload_codec, upload_quality, download_video, timer
+            )
+        except Exception:
+            timer.finish(status="error")
+            raise
+        text_output = "\n".join([text_output, ""] + timer.summary_lines())
+        return (video_url, text_output, video_file_path, timer.finish())
     
-    def generate_video(self, prompt, model, duration, watermark, base_url,
-                       poll_interval, max_wait_time, image=None, video=None, video_url="", audio=None):
-        self.initialize_client(base_url)
+    async def _generate_video(self, prompt, model, duration, watermark, base_url, poll_interval, max_wait_time,
+                              image, video, video_url, audio, upload_codec, upload_quality, download_video, timer):
+        with timer.span("client_init"):
+            self.initialize_client(base_url)
         
         wm_str = "true" if watermark else "false"
         full_prompt = f"{prompt} --wm {wm_str} --dur {duration}"
         
         content = []
         input_modes = []
+        upload_stats = []
         reference_video_url = self._resolve_reference_video_url(video_url)
         use_reference_mode = (reference_video_url is not None) or (video is not None) or (audio is not None)
         
         if image is not None:
-            pil_img = self.tensor_to_pil(image.squeeze(0))
-            img_url = self.image_to_base64_url(pil_img)
+            with timer.span("encode", media="image"):
+                pil_img = self.tensor_to_pil(image.squeeze(0))
+                img_url = self.image_to_base64_url(pil_img, upload_codec, upload_quality, upload_stats)
             image_item = {"type": "image_url", "image_url": {"url": img_url}}
             if use_reference_mode:
                 image_item["role"] = "reference_image"
@@ -1229,7 +2826,8 @@ class SeedanceVideoGenerate:
         
         video_media_url = reference_video_url
         if not video_media_url and video is not None:
-            video_media_url = self._video_input_to_media_url(video)
+            with timer.span("encode", media="video"):
+                video_media_url = self._video_input_to_media_url(video)
         if video_media_url:
             content.append({
                 "type": "video_url",
@@ -1239,7 +2837,10 @@ class SeedanceVideoGenerate:
             input_modes.append("视频")
             print(f"🎥 使用输入视频")
         
-        audio_media_url = self._audio_input_to_media_url(audio)
+        audio_media_url = None
+        if audio is not None:
+            with timer.span("encode", media="audio"):
+                audio_media_url = self._audio_input_to_media_url(audio)
         if audio_media_url:
             content.append({
                 "type": "audio_url",
@@ -1262,66 +2863,252 @@ class SeedanceVideoGenerate:
         print(f"   时长: {duration}秒")
         print(f"   水印: {'是' if watermark else '否'}")
         
-        create_result = self.client.content_generation.tasks.create(
-            model=model,
-            content=content
-        )
+        governor = _get_api_governor(base_url, model)
+        
+        def create_task():
+            with governor.slot(timer):
+                return self.client.content_generation.tasks.create(model=model, content=content)
+        
+        with timer.span("request"):
+            create_result = await asyncio.to_thread(create_task)
         
         task_id = create_result.id
         print(f"   任务ID: {task_id}")
-        print(f"🔄 开始轮询任务状态 (间隔 {poll_interval}秒, 最大等待 {max_wait_time}秒)")
+        print(f"🔄 开始轮询任务状态 (间隔上限 {poll_interval}秒, 最大等待 {max_wait_time}秒)")
         
-        elapsed = 0
-        while elapsed < max_wait_time:
-            get_result = self.client.content_generation.tasks.get(task_id=task_id)
-            status = get_result.status
-            
-            if status == "succeeded":
-                print(f"✅ 视频生成成功! (耗时约 {elapsed}秒)")
-                print(f"   完整响应: {get_result}")
-                
-                video_url = self._extract_video_url(get_result)
-                if not video_url:
-                    raise RuntimeError(f"视频生成成功但未能提取视频URL，任务ID: {task_id}，请查看控制台完整响应")
-                
-                meta = self._extract_result_metadata(get_result)
-                # video_file_path = self._download_video(video_url, task_id)
-                
-                result_info = [
-                    f"🎬 视频生成信息:",
-                    f"📝 提示词: {prompt}",
-                    f"🔧 模型: {model}",
-                    f"🎯 模式: {mode_desc}",
-                    f"⏱️ 时长: {meta.get('duration', duration)}秒",
-                    f"💧 水印: {'是' if watermark else '否'}",
-                    f"🆔 任务ID: {task_id}",
-                    f"⏳ 耗时: 约{elapsed}秒",
-                ]
-                if meta.get('resolution'):
-                    result_info.append(f"📺 分辨率: {meta['resolution']}")
-                if meta.get('ratio'):
-                    result_info.append(f"📐 宽高比: {meta['ratio']}")
-                if meta.get('framespersecond'):
-                    result_info.append(f"🎞️ 帧率: {meta['framespersecond']}fps")
-                if meta.get('seed') is not None:
-                    result_info.append(f"🎲 种子值: {meta['seed']}")
-                if meta.get('total_tokens') is not None:
-                    result_info.append(f"📊 Token消耗: {meta['total_tokens']}")
-                result_info.append(f"🔗 视频URL: {video_url}")
-                result_info.append(f"⚡ 状态: 成功")
-                
-                return (video_url, "\n".join(result_info))
-            
-            elif status == "failed":
-                error_msg = getattr(get_result, 'error', 'Unknown error')
-                raise RuntimeError(f"视频生成失败 (任务ID: {task_id}): {error_msg}")
-            
-            else:
-                print(f"   当前状态: {status}，{poll_interval}秒后重试... (已等待 {elapsed}秒)")
-                time.sleep(poll_interval)
-                elapsed += poll_interval
+        wait_start = time.time()
+        with timer.span("task_wait"):
+            get_result = await _get_seedance_task_tracker().wait(
+                self.client, task_id, poll_interval, max_wait_time, governor
+            )
+        elapsed = int(time.time() - wait_start)
+        status = get_result.status
+        
+        if status != "succeeded":
+            error_msg = getattr(get_result, 'error', None) or f"任务状态: {status}"
+            raise RuntimeError(f"视频生成失败 (任务ID: {task_id}): {error_msg}")
         
-        raise TimeoutError(f"视频生成超时 (任务ID: {task_id})，已等待 {max_wait_time}秒，可增大 max_wait_time 参数后重试")
+        print(f"✅ 视频生成成功! (耗时约 {elapsed}秒)")
+        print(f"   完整响应: {get_result}")
+        
+        video_url = self._extract_video_url(get_result)
+        if not video_url:
+            raise RuntimeError(f"视频生成成功但未能提取视频URL，任务ID: {task_id}，请查看控制台完整响应")
+        
+        meta = self._extract_result_metadata(get_result)
+        video_file_path = ""
+        if download_video:
+            try:
+                with timer.span("download"):
+                    video_file_path = await asyncio.to_thread(self._download_video, video_url, task_id)
+            except Exception as e:
+                raise RuntimeError(f"视频生成成功但下载失败 (任务ID: {task_id}, URL: {video_url}): {e}") from e
+        
+        result_info = [
+            f"🎬 视频生成信息:",
+            f"📝 提示词: {prompt}",
+            f"🔧 模型: {model}",
+            f"🎯 模式: {mode_desc}",
+            f"⏱️ 时长: {meta.get('duration', duration)}秒",
+            f"💧 水印: {'是' if watermark else '否'}",
+            f"🆔 任务ID: {task_id}",
+            f"⏳ 耗时: 约{elapsed}秒",
+        ]
+        if upload_stats:
+            result_info.extend(_format_upload_stats(upload_stats))
+        if meta.get('resolution'):
+            result_info.append(f"📺 分辨率: {meta['resolution']}")
+        if meta.get('ratio'):
+            result_info.append(f"📐 宽高比: {meta['ratio']}")
+        if meta.get('framespersecond'):
+            result_info.append(f"🎞️ 帧率: {meta['framespersecond']}fps")
+        if meta.get('seed') is not None:
+            result_info.append(f"🎲 种子值: {meta['seed']}")
+        if meta.get('total_tokens') is not None:
+            result_info.append(f"📊 Token消耗: {meta['total_tokens']}")
+        result_info.append(f"🔗 视频URL: {video_url}")
+        if video_file_path:
+            result_info.append(f"💾 本地文件: {video_file_path}")
+        result_info.append(f"⚡ 状态: 成功")
+        
+        return (video_url, "\n".join(result_info), video_file_path)
+
+
+# TOS 上传：分块读取 + 增量哈希，大文件走并发分片上传
+TOS_MULTIPART_PART_SIZE = 8 * 1024 * 1024  # 分片大小（TOS 要求除最后一片外不小于5MB）
+TOS_MULTIPART_CONCURRENCY = 4  # 同时在途的分片数，峰值内存约为 分片大小 x 并发数
+TOS_BATCH_CONCURRENCY = 4  # 批量上传节点默认同时上传的文件数
+TOS_READ_CHUNK_SIZE = 1024 * 1024  # 哈希时的读取块大小
+
+
+# TOS 复用模式的本地索引：文件指纹 -> 内容哈希，对象 -> 最近一次预签名URL
+TOS_INDEX_MAX_FILES = 2000
+TOS_INDEX_OBJECT_MAX_AGE_SECONDS = 7 * 24 * 3600  # 对象记录超过该时间未再验证即从索引删除
+TOS_URL_REFRESH_MARGIN_SECONDS = 300  # 预签名URL剩余有效期低于 max(该值, 时效的10%) 时重新签名
+
+
+class _TosUploadIndex:
+    """
+    Persistent JSON index under the ComfyUI user directory.
+    files:   "<realpath>|<size>|<mtime_ns>|<inode>" -> {"sha256", "last_used"}
+    objects: "<endpoint>|<bucket>|<object_key>"     -> {"verified_at", "url", "url_expires_at", "expires_seconds"}
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data = None
+
+    def _path(self):
+        return os.path.join(_user_data_directory(), "seedream_tos_index.json")
+
+    def _load(self):
+        if self._data is None:
+            try:
+                with open(self._path(), "r", encoding="utf-8") as f:
+                    self._data = json.load(f)
+            except (OSError, ValueError):
+                self._data = {}
+            self._data.setdefault("files", {})
+            self._data.setdefault("objects", {})
+        return self._data
+
+    def _save(self):
+        path = self._path()
+        tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._data, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"⚠️ 写入 TOS 本地索引失败: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    @staticmethod
+    def fingerprint(path):
+        st = os.stat(path)
+        return f"{os.path.realpath(path)}|{st.st_size}|{st.st_mtime_ns}|{st.st_ino}"
+
+    @staticmethod
+    def object_id(endpoint, bucket, object_key):
+        return f"{endpoint.strip()}|{bucket.strip()}|{object_key}"
+
+    def lookup_hash(self, fingerprint):
+        with self._lock:
+            entry = self._load()["files"].get(fingerprint)
+            return entry["sha256"] if entry else None
+
+    def lookup_object(self, object_id):
+        """Return a copy of the object entry, or None"""
+        with self._lock:
+            entry = self._load()["objects"].get(object_id)
+            return dict(entry) if entry else None
+
+    def forget_object(self, object_id):
+        """Drop an object entry whose object no longer exists in TOS"""
+        with self._lock:
+            if self._load()["objects"].pop(object_id, None) is not None:
+                self._save()
+
+    def record(self, fingerprint=None, content_hash=None, object_id=None, url=None, url_expires_at=None,
+               expires_seconds=None, verified=False):
+        now = time.time()
+        with self._lock:
+            data = self._load()
+            if fingerprint and content_hash:
+                data["files"][fingerprint] = {"sha256": content_hash, "last_used": now}
+                if len(data["files"]) > TOS_INDEX_MAX_FILES:
+                    oldest = sorted(data["files"].items(), key=lambda item: item[1].get("last_used", 0))
+                    for key, _ in oldest[:len(data["files"]) - TOS_INDEX_MAX_FILES]:
+                        del data["files"][key]
+            if object_id:
+                entry = data["objects"].setdefault(object_id, {})
+                if verified:
+                    entry["verified_at"] = now
+                if url:
+                    entry["url"] = url
+                    entry["url_expires_at"] = url_expires_at
+                    entry["expires_seconds"] = expires_seconds
+                # 清理长时间未再验证（即长时间未使用）的对象记录
+                for key in [k for k, v in data["objects"].items()
+                            if now - v.get("verified_at", 0) >= TOS_INDEX_OBJECT_MAX_AGE_SECONDS]:
+                    del data["objects"][key]
+            self._save()
+
+
+def _presigned_url_still_valid(expires_at, expires_seconds):
+    """True while a signed URL has more than the refresh margin of life left"""
+    margin = max(TOS_URL_REFRESH_MARGIN_SECONDS, expires_seconds * 0.1)
+    return expires_at - time.time() > margin
+
+
+_tos_upload_index = _TosUploadIndex()
+
+
+class _PresignedUrlCache:
+    """
+    In-memory cache of presigned URLs keyed by (scope, bucket, key, expires_seconds).
+    URLs are handed out while they have more than the refresh margin left; once under twice
+    the margin a background thread re-signs them so callers rarely wait on signing.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, sign, expires_seconds):
+        """Return (url, expires_at) for key, signing synchronously only when nothing usable is cached"""
+        margin = max(TOS_URL_REFRESH_MARGIN_SECONDS, expires_seconds * 0.1)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry["expires_at"] - now > margin:
+                if entry["expires_at"] - now < 2 * margin and not entry["refreshing"]:
+                    entry["refreshing"] = True
+                    threading.Thread(
+                        target=self._refresh, args=(key, sign, expires_seconds),
+                        name="tos-presign-refresh", daemon=True
+                    ).start()
+                return entry["url"], entry["expires_at"]
+
+        url = sign()
+        self._store(key, url, now + expires_seconds)
+        return url, now + expires_seconds
+
+    def _refresh(self, key, sign, expires_seconds):
+        signed_at = time.time()
+        try:
+            url = sign()
+        except Exception as e:
+            print(f"⚠️ 后台刷新预签名URL失败，将在过期前同步重签: {e}")
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    entry["refreshing"] = False
+            return
+        self._store(key, url, signed_at + expires_seconds)
+
+    def _store(self, key, url, expires_at):
+        with self._lock:
+            self._entries[key] = {"url": url, "expires_at": expires_at, "refreshing": False}
+            now = time.time()
+            for stale_key in [k for k, v in self._entries.items() if v["expires_at"] <= now]:
+                del self._entries[stale_key]
+
+
+_presigned_url_cache = _PresignedUrlCache()
+_tos_call_forms = {}  # (TosClientV2 类型, 操作名) -> 已验证可用的调用形式下标
+_tos_clients = {}  # _tos_credentials_scope -> TosClientV2
+_tos_clients_lock = threading.Lock()
+
+
+def _tos_credentials_scope(endpoint, region):
+    """Identity of a TOS endpoint/region/credential combination, without exposing the keys"""
+    access_key = (os.environ.get("TOS_ACCESS_KEY") or "").strip()
+    secret_key = (os.environ.get("TOS_SECRET_KEY") or "").strip()
+    key_hash = hashlib.sha256(f"{access_key}:{secret_key}".encode("utf-8")).hexdigest()
+    return (endpoint.strip(), region.strip(), key_hash)
 
 
 class TOSUploadVideoURL:
@@ -1374,8 +3161,8 @@ class TOSUploadVideoURL:
             }
         }
 
-    RETURN_TYPES = ("STRING", "STRING", "BOOLEAN", "STRING")
-    RETURN_NAMES = ("url", "object_key", "is_reused", "text")
+    RETURN_TYPES = ("STRING", "STRING", "BOOLEAN", "STRING", "STRING")
+    RETURN_NAMES = ("url", "object_key", "is_reused", "text", "metrics")
     FUNCTION = "upload_video"
     CATEGORY = "video/upload"
 
@@ -1389,6 +3176,7 @@ class TOSUploadVideoURL:
             ) from e
 
     def _initialize_tos_client(self, endpoint, region):
+        """Return a cached TosClientV2 for (endpoint, region, credentials), creating it on first use"""
         tos = self._import_tos()
         access_key = os.environ.get("TOS_ACCESS_KEY")
         secret_key = os.environ.get("TOS_SECRET_KEY")
@@ -1396,7 +3184,30 @@ class TOSUploadVideoURL:
         if not access_key or not secret_key:
             raise ValueError("请先设置环境变量 TOS_ACCESS_KEY 和 TOS_SECRET_KEY")
 
-        return tos.TosClientV2(access_key.strip(), secret_key.strip(), endpoint.strip(), region.strip())
+        scope = _tos_credentials_scope(endpoint, region)
+        with _tos_clients_lock:
+            # 同一 endpoint/region 的密钥已轮换时丢弃旧客户端。这里有意不调用 close()：
+            # 其他线程上进行中的上传可能仍持有旧客户端，且 TosClientV2.close() 还会关闭进程级的 DNS 缓存；
+            # 旧客户端的连接池在最后一个引用释放后由 GC 回收
+            for cached_scope in [k for k in _tos_clients if k[:2] == scope[:2] and k != scope]:
+                del _tos_clients[cached_scope]
+            client = _tos_clients.get(scope)
+            if client is None:
+                client = tos.TosClientV2(access_key.strip(), secret_key.strip(), endpoint.strip(), region.strip())
+                _tos_clients[scope] = client
+            return client
+
+    def _call_form_order(self, client, operation, count):
+        """Indices of the SDK call forms to try, the one known to work for this client type first"""
+        order = list(range(count))
+        known_index = _tos_call_forms.get((type(client), operation))
+        if known_index is not None:
+            order.remove(known_index)
+            order.insert(0, known_index)
+        return order
+
+    def _remember_call_form(self, client, operation, index):
+        _tos_call_forms[(type(client), operation)] = index
 
     def _normalize_file_path(self, file_path):
         if file_path is None:
@@ -1455,19 +3266,110 @@ class TOSUploadVideoURL:
     def _hash_bytes(self, data):
         return hashlib.sha256(data).hexdigest()
 
+    def _open_source(self, source):
+        """
+        Return a seekable binary file object for the source, rewound to the start.
+        Non-seekable VIDEO streams are spooled to a temporary file first.
+        """
+        if source["kind"] == "path":
+            return open(source["path"], "rb")
+
+        stream = source["stream"]
+        seekable = getattr(stream, "seekable", None)
+        if callable(seekable) and seekable():
+            stream.seek(0)
+            return stream
+
+        spooled = tempfile.SpooledTemporaryFile(max_size=TOS_MULTIPART_PART_SIZE)
+        shutil.copyfileobj(stream, spooled, TOS_READ_CHUNK_SIZE)
+        spooled.seek(0)
+        return spooled
+
+    def _source_size(self, source, fileobj):
+        if source["kind"] == "path":
+            return os.path.getsize(source["path"])
+        position = fileobj.tell()
+        size = fileobj.seek(0, os.SEEK_END)
+        fileobj.seek(position)
+        return size
+
+    def _hash_fileobj(self, fileobj):
+        """SHA-256 of a file object read in fixed-size chunks; rewinds it afterwards"""
+        hasher = hashlib.sha256()
+        fileobj.seek(0)
+        for chunk in iter(lambda: fileobj.read(TOS_READ_CHUNK_SIZE), b""):
+            hasher.update(chunk)
+        fileobj.seek(0)
+        return hasher.hexdigest()
+
+    def _upload_fileobj(self, client, bucket, object_key, fileobj, size, content_type, hasher=None):
+        """
+        Upload fileobj to TOS. Files up to one part use a single put_object; larger files use
+        multipart upload with up to TOS_MULTIPART_CONCURRENCY parts in flight. hasher, when
+        given, is updated with every byte read.
+        """
+        if size <= TOS_MULTIPART_PART_SIZE:
+            data = fileobj.read()
+            if hasher is not None:
+                hasher.update(data)
+            self._put_object_with_fallbacks(client, bucket, object_key, data, content_type)
+            return 1
+
+        tos = self._import_tos()
+        upload_id = client.create_multipart_upload(bucket, object_key, content_type=content_type).upload_id
+        in_flight = threading.BoundedSemaphore(TOS_MULTIPART_CONCURRENCY)
+
+        def upload_part(part_number, data):
+            try:
+                return client.upload_part(bucket, object_key, upload_id, part_number, content=data).etag
+            finally:
+                in_flight.release()
+
+        futures = []
+        try:
+            with ThreadPoolExecutor(max_workers=TOS_MULTIPART_CONCURRENCY, thread_name_prefix="tos-part") as executor:
+                part_number = 1
+                while True:
+                    failed = next((f for _, f in futures if f.done() and f.exception() is not None), None)
+                    if failed is not None:
+                        raise failed.exception()
+                    # 先占用在途名额再读取，保证内存中最多只有 TOS_MULTIPART_CONCURRENCY 个分片
+                    in_flight.acquire()
+                    data = fileobj.read(TOS_MULTIPART_PART_SIZE)
+                    if not data:
+                        in_flight.release()
+                        break
+                    if hasher is not None:
+                        hasher.update(data)
+                    futures.append((part_number, executor.submit(upload_part, part_number, data)))
+                    part_number += 1
+                    del data
+                parts = [tos.models2.UploadedPart(number, future.result()) for number, future in futures]
+            client.complete_multipart_upload(bucket, object_key, upload_id, parts=parts)
+        except Exception:
+            try:
+                client.abort_multipart_upload(bucket, object_key, upload_id)
+            except Exception as abort_error:
+                print(f"⚠️ 取消分片上传失败 (upload_id={upload_id}): {abort_error}")
+            raise
+        return len(futures)
+
     def _object_exists(self, client, bucket, object_key):
         attempts = [
             lambda: client.head_object(bucket=bucket, key=object_key),
             lambda: client.head_object(bucket, object_key),
         ]
 
-        for attempt in attempts:
+        for index in self._call_form_order(client, "head_object", len(attempts)):
             try:
-                attempt()
+                attempts[index]()
+                self._remember_call_form(client, "head_object", index)
                 return True
             except Exception as e:
                 error_name = e.__class__.__name__
                 if error_name in ("TosServerError", "TosClientError"):
+                    # SDK 接受了该调用形式（服务端/客户端业务错误），记住它
+                    self._remember_call_form(client, "head_object", index)
                     status_code = getattr(e, "status_code", None)
                     if status_code == 404:
                         return False
@@ -1486,16 +3388,18 @@ class TOSUploadVideoURL:
         ]
 
         last_error = None
-        for attempt in attempts:
+        for index in self._call_form_order(client, "put_object", len(attempts)):
             try:
-                return attempt()
+                result = attempts[index]()
+                self._remember_call_form(client, "put_object", index)
+                return result
             except TypeError as e:
                 last_error = e
 
         if last_error is not None:
             raise last_error
 
-    def _generate_presigned_url(self, client, bucket, object_key, expires_seconds):
+    def _sign_presigned_url(self, client, bucket, object_key, expires_seconds):
         tos = self._import_tos()
         http_method = getattr(getattr(tos, "HttpMethodType", None), "Http_Method_Get", None)
 
@@ -1506,11 +3410,13 @@ class TOSUploadVideoURL:
             lambda: client.pre_signed_url("GET", bucket, object_key, expires_seconds),
         ]
 
+        # 已知可用的调用形式优先尝试，避免每次都从头探测
         result = None
         last_error = None
-        for attempt in attempts:
+        for index in self._call_form_order(client, "pre_signed_url", len(attempts)):
             try:
-                result = attempt()
+                result = attempts[index]()
+                self._remember_call_form(client, "pre_signed_url", index)
                 break
             except TypeError as e:
                 last_error = e
@@ -1528,53 +3434,298 @@ class TOSUploadVideoURL:
 
         return str(result)
 
-    def upload_video(self, bucket, endpoint, region, expires_seconds, reuse_existing, object_prefix, video=None, file_path=""):
-        client = self._initialize_tos_client(endpoint, region)
-        source = self._resolve_video_source(video=video, file_path=file_path)
+    def _generate_presigned_url_with_expiry(self, client, bucket, object_key, expires_seconds, cache_scope=None):
+        """
+        Return (presigned GET URL, expires_at_timestamp). With cache_scope (endpoint/region/credential
+        identity) a still-valid cached URL is returned and re-signed in the background before it expires.
+        """
+        if cache_scope is None:
+            signed_at = time.time()
+            return self._sign_presigned_url(client, bucket, object_key, expires_seconds), signed_at + expires_seconds
+        return _presigned_url_cache.get(
+            (cache_scope, bucket, object_key, expires_seconds),
+            lambda: self._sign_presigned_url(client, bucket, object_key, expires_seconds),
+            expires_seconds
+        )
+
+    def _upload_source(self, client, source, bucket, endpoint, region, expires_seconds, reuse_existing, object_prefix,
+                       content_hash=None, timer=None):
+        """
+        Upload one resolved source (or reuse the existing object) and sign its URL.
+        content_hash, when already known, skips hashing the file again.
+        """
         ext = self._validate_video_filename(source["filename"])
         content_type = mimetypes.guess_type(source["filename"])[0] or ("video/mp4" if ext == ".mp4" else "video/quicktime")
 
-        if source["kind"] == "path":
-            file_size_bytes = os.path.getsize(source["path"])
-            with open(source["path"], "rb") as f:
-                data = f.read()
-        else:
-            stream = source["stream"]
-            data = stream.read()
-            file_size_bytes = len(data)
+        fingerprint = _tos_upload_index.fingerprint(source["path"]) if reuse_existing and source["kind"] == "path" else None
+        object_id = None
+        indexed_object = None
+        index_hit = False
+        url_from_index = False
 
-        file_size_mb = file_size_bytes / (1024 * 1024)
-        if file_size_mb > 50:
-            raise ValueError(f"视频大小约 {file_size_mb:.2f} MB，超过参考视频 50 MB 限制")
-
-        content_hash = self._hash_bytes(data)
-        if reuse_existing:
-            object_key = self._build_object_key(object_prefix, source["filename"], content_hash=content_hash)
-            reused_existing = self._object_exists(client, bucket.strip(), object_key)
+        fileobj = self._open_source(source)
+        try:
+            file_size_bytes = self._source_size(source, fileobj)
+            file_size_mb = file_size_bytes / (1024 * 1024)
+            if file_size_mb > 50:
+                raise ValueError(f"视频大小约 {file_size_mb:.2f} MB，超过参考视频 50 MB 限制")
+
+            part_count = 0
+            if reuse_existing:
+                # 对象名依赖内容哈希：优先用本地索引中的哈希，未命中时分块读取一遍计算
+                if content_hash is None:
+                    content_hash = _tos_upload_index.lookup_hash(fingerprint) if fingerprint else None
+                    index_hit = content_hash is not None
+                    if content_hash is None:
+                        with _span(timer, "hash"):
+                            content_hash = self._hash_fileobj(fileobj)
+                object_key = self._build_object_key(object_prefix, source["filename"], content_hash=content_hash)
+                object_id = _tos_upload_index.object_id(endpoint, bucket, object_key)
+                indexed_object = _tos_upload_index.lookup_object(object_id)
+                # 只在索引中的预签名URL仍有效时跳过 TOS；URL 临近过期需要重新签名时先确认对象仍存在
+                url_from_index = bool(
+                    indexed_object is not None
+                    and indexed_object.get("url")
+                    and indexed_object.get("expires_seconds") == expires_seconds
+                    and _presigned_url_still_valid(indexed_object.get("url_expires_at", 0), expires_seconds)
+                )
+                if url_from_index:
+                    reused_existing = True
+                else:
+                    with _span(timer, "head_object"):
+                        reused_existing = self._object_exists(client, bucket.strip(), object_key)
+                    if not reused_existing and indexed_object is not None:
+                        print(f"⚠️ 本地索引中的对象已不存在（可能被生命周期规则删除），重新上传: {object_key}")
+                        _tos_upload_index.forget_object(object_id)
+                        indexed_object = None
+                if not reused_existing:
+                    with _span(timer, "upload", bytes=file_size_bytes):
+                        part_count = self._upload_fileobj(client, bucket.strip(), object_key, fileobj, file_size_bytes, content_type)
+            else:
+                # 不复用时边读边哈希边上传，只读取一遍
+                object_key = self._build_object_key(object_prefix, source["filename"])
+                reused_existing = False
+                hasher = hashlib.sha256() if content_hash is None else None
+                with _span(timer, "upload", bytes=file_size_bytes):
+                    part_count = self._upload_fileobj(client, bucket.strip(), object_key, fileobj, file_size_bytes, content_type, hasher)
+                if hasher is not None:
+                    content_hash = hasher.hexdigest()
+        finally:
+            if fileobj is not source.get("stream"):
+                fileobj.close()
+
+        if url_from_index:
+            signed_url = indexed_object["url"]
+            url_expires_at = indexed_object["url_expires_at"]
         else:
-            object_key = self._build_object_key(object_prefix, source["filename"])
-            reused_existing = False
+            with _span(timer, "presign"):
+                signed_url, url_expires_at = self._generate_presigned_url_with_expiry(
+                    client, bucket.strip(), object_key, expires_seconds,
+                    cache_scope=_tos_credentials_scope(endpoint, region)
+                )
+        if reuse_existing:
+            _tos_upload_index.record(
+                fingerprint=fingerprint, content_hash=content_hash, object_id=object_id,
+                url=None if url_from_index else signed_url, url_expires_at=url_expires_at,
+                expires_seconds=expires_seconds, verified=not url_from_index
+            )
 
-        if not reused_existing:
-            self._put_object_with_fallbacks(client, bucket.strip(), object_key, data, content_type)
-        signed_url = self._generate_presigned_url(client, bucket.strip(), object_key, expires_seconds)
+        return {
+            "url": signed_url,
+            "object_key": object_key,
+            "reused": reused_existing,
+            "content_hash": content_hash,
+            "filename": source["filename"],
+            "size_mb": file_size_mb,
+            "part_count": part_count,
+            "index_hit": index_hit,
+            "url_from_index": url_from_index,
+            "indexed": indexed_object is not None,
+        }
+
+    def upload_video(self, bucket, endpoint, region, expires_seconds, reuse_existing, object_prefix, video=None, file_path=""):
+        timer = _PhaseTimer(self.__class__.__name__)
+        try:
+            with timer.span("client_init"):
+                client = self._initialize_tos_client(endpoint, region)
+            source = self._resolve_video_source(video=video, file_path=file_path)
+            upload = self._upload_source(client, source, bucket, endpoint, region, expires_seconds, reuse_existing,
+                                         object_prefix, timer=timer)
+        except Exception:
+            timer.finish(status="error")
+            raise
+        reused_existing = upload["reused"]
+        part_count = upload["part_count"]
+        index_hit = upload["index_hit"]
 
         result_info = [
             "📤 TOS 上传成功" if not reused_existing else "♻️ 复用已有 TOS 对象",
             f"🪣 Bucket: {bucket}",
             f"🌍 Region: {region}",
             f"🔗 Endpoint: {endpoint}",
-            f"📁 Object Key: {object_key}",
+            f"📁 Object Key: {upload['object_key']}",
             f"♻️ 复用开关: {'开启' if reuse_existing else '关闭'}",
             f"♻️ 是否复用: {'是' if reused_existing else '否'}",
-            f"🧮 SHA256: {content_hash}",
-            f"🎞️ 文件名: {source['filename']}",
-            f"📦 文件大小: {file_size_mb:.2f} MB",
+            f"🧮 SHA256: {upload['content_hash']}" + (" (本地索引)" if index_hit else ""),
+            f"🎞️ 文件名: {upload['filename']}",
+            f"📦 文件大小: {upload['size_mb']:.2f} MB",
+            f"🧩 上传方式: {'未上传' if reused_existing else ('分片上传 ' + str(part_count) + ' 片' if part_count > 1 else '单次上传')}",
+            f"⏳ 时效: {expires_seconds} 秒",
+            f"🗂️ 本地索引: {'命中，未读取文件/未访问TOS' if index_hit and upload['url_from_index'] else ('命中' if index_hit or upload['indexed'] else '未命中')}",
+            f"🔗 URL: {upload['url']}",
+            "",
+        ]
+        result_info.extend(timer.summary_lines())
+
+        return (upload["url"], upload["object_key"], reused_existing, "\n".join(result_info), timer.finish())
+
+
+class TOSBatchUploadVideoURL(TOSUploadVideoURL):
+    """
+    Upload many local videos to Volcengine TOS concurrently and output their pre-signed URLs
+    in input order. Files with identical content are uploaded once.
+    """
+
+    @classmethod
+    def INPUT_TYPES(cls):
+        input_types = super().INPUT_TYPES()
+        input_types["required"]["paths"] = ("STRING", {
+            "multiline": True,
+            "default": "",
+            "placeholder": "/path/to/clips/\n/path/to/more/*.mp4\n/path/to/single.mov",
+            "tooltip": "每行一项：目录（上传其中的 .mp4/.mov）、通配符（支持 **）或单个文件路径"
+        })
+        input_types["optional"] = {
+            "max_concurrency": ("INT", {
+                "default": TOS_BATCH_CONCURRENCY,
+                "min": 1,
+                "max": 16,
+                "step": 1,
+                "tooltip": "同时上传的文件数量上限"
+            }),
+        }
+        return input_types
+
+    RETURN_TYPES = ("STRING", "STRING", "STRING", "STRING")
+    RETURN_NAMES = ("urls", "object_keys", "text", "metrics")
+    OUTPUT_IS_LIST = (True, True, False, False)
+    FUNCTION = "upload_videos"
+
+    def _expand_paths(self, paths):
+        """Expand directory / glob / file lines into an ordered list of video file paths"""
+        expanded = []
+        for line in (paths or "").splitlines():
+            entry = self._normalize_file_path(line)
+            if not entry:
+                continue
+            if os.path.isdir(entry) or glob.has_magic(entry):
+                # 目录与通配符只收集 .mp4/.mov，其他文件跳过并提示；显式列出的文件才做严格校验
+                if os.path.isdir(entry):
+                    candidates = [os.path.join(entry, name) for name in sorted(os.listdir(entry))]
+                else:
+                    candidates = sorted(glob.glob(entry, recursive=True))
+                files = [path for path in candidates if os.path.isfile(path)]
+                matches = [path for path in files if os.path.splitext(path)[1].lower() in (".mp4", ".mov")]
+                skipped = [os.path.basename(path) for path in files
+                           if os.path.splitext(path)[1].lower() not in (".mp4", ".mov")]
+                if skipped:
+                    preview = ", ".join(skipped[:5]) + (" ..." if len(skipped) > 5 else "")
+                    print(f"⚠️ {entry}: 跳过 {len(skipped)} 个非 .mp4/.mov 文件 ({preview})")
+                if not matches:
+                    print(f"⚠️ 没有匹配到 .mp4/.mov 文件: {entry}")
+            elif os.path.isfile(entry):
+                self._validate_video_filename(entry)
+                matches = [entry]
+            else:
+                raise ValueError(f"路径不存在: {entry}")
+            expanded.extend(matches)
+
+        if not expanded:
+            raise ValueError("paths 中没有找到任何可上传的视频文件")
+        return expanded
+
+    def _content_hash(self, path, timer=None):
+        """SHA-256 of a file, served from the local upload index when the file is unchanged"""
+        fingerprint = _tos_upload_index.fingerprint(path)
+        content_hash = _tos_upload_index.lookup_hash(fingerprint) if fingerprint else None
+        if content_hash is not None:
+            return content_hash, True
+        with _span(timer, "hash", file=os.path.basename(path)), open(path, "rb") as fileobj:
+            return self._hash_fileobj(fileobj), False
+
+    def upload_videos(self, bucket, endpoint, region, expires_seconds, reuse_existing, object_prefix, paths, max_concurrency=TOS_BATCH_CONCURRENCY):
+        timer = _PhaseTimer(self.__class__.__name__)
+        try:
+            urls, object_keys, text_output = self._upload_videos(
+                bucket, endpoint, region, expires_seconds, reuse_existing, object_prefix, paths, max_concurrency, timer
+            )
+        except Exception:
+            timer.finish(status="error")
+            raise
+        text_output = "\n".join([text_output, ""] + timer.summary_lines())
+        return (urls, object_keys, text_output, timer.finish())
+
+    def _upload_videos(self, bucket, endpoint, region, expires_seconds, reuse_existing, object_prefix, paths, max_concurrency, timer):
+        with timer.span("client_init"):
+            client = self._initialize_tos_client(endpoint, region)
+        file_paths = self._expand_paths(paths)
+        max_workers = max(1, min(int(max_concurrency), len(file_paths)))
+        start_time = time.time()
+
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tos-batch") as executor:
+            # 先哈希去重：相同内容只上传/签名一次，结果按输入顺序回填
+            hashes = list(executor.map(lambda path: self._content_hash(path, timer), file_paths))
+            unique_paths = {}
+            for path, (content_hash, _) in zip(file_paths, hashes):
+                unique_paths.setdefault(content_hash, path)
+
+            futures = {
+                content_hash: executor.submit(
+                    self._upload_source, client,
+                    {"kind": "path", "path": path, "filename": os.path.basename(path)},
+                    bucket, endpoint, region, expires_seconds, reuse_existing, object_prefix,
+                    content_hash=content_hash, timer=timer.child(file=os.path.basename(path))
+                )
+                for content_hash, path in unique_paths.items()
+            }
+
+            uploads = {}
+            failures = []
+            for content_hash, future in futures.items():
+                try:
+                    uploads[content_hash] = future.result()
+                except Exception as e:
+                    failures.append(f"{unique_paths[content_hash]}: {e}")
+
+        if failures:
+            raise RuntimeError(f"批量上传失败 {len(failures)}/{len(unique_paths)} 个文件:\n" + "\n".join(failures))
+
+        urls = []
+        object_keys = []
+        for content_hash, _ in hashes:
+            urls.append(uploads[content_hash]["url"])
+            object_keys.append(uploads[content_hash]["object_key"])
+
+        uploaded = [u for u in uploads.values() if not u["reused"]]
+        total_size_mb = sum(u["size_mb"] for u in uploads.values())
+        result_info = [
+            "📤 TOS 批量上传完成",
+            f"🪣 Bucket: {bucket}",
+            f"🌍 Region: {region}",
+            f"🔗 Endpoint: {endpoint}",
+            f"📋 输入文件: {len(file_paths)} 个，去重后 {len(unique_paths)} 个",
+            f"📤 实际上传: {len(uploaded)} 个，♻️ 复用已有对象: {len(unique_paths) - len(uploaded)} 个",
+            f"🗂️ 本地索引命中哈希: {sum(1 for _, index_hit in hashes if index_hit)} 个",
+            f"📦 总大小: {total_size_mb:.2f} MB",
+            f"⚡ 并发数: {max_workers}",
             f"⏳ 时效: {expires_seconds} 秒",
-            f"🔗 URL: {signed_url}",
+            f"⏱️ 耗时: {time.time() - start_time:.2f} 秒",
+            "",
         ]
+        for index, (path, object_key) in enumerate(zip(file_paths, object_keys), 1):
+            result_info.append(f"{index}. {os.path.basename(path)} -> {object_key}")
 
-        return (signed_url, object_key, reused_existing, "\n".join(result_info))
+        return (urls, object_keys, "\n".join(result_info))
 
 
 # Node mappings for ComfyUI
@@ -1583,7 +3734,8 @@ NODE_CLASS_MAPPINGS = {
     "SeedreamImageGenerateV2": SeedreamImageGenerateV2,
     "SeedreamImageGenerateWithWebSearch": SeedreamImageGenerateWithWebSearch,
     "SeedanceVideoGenerate": SeedanceVideoGenerate,
-    "TOSUploadVideoURL": TOSUploadVideoURL
+    "TOSUploadVideoURL": TOSUploadVideoURL,
+    "TOSBatchUploadVideoURL": TOSBatchUploadVideoURL
 }
 
 NODE_DISPLAY_NAME_MAPPINGS = {
@@ -1591,5 +3743,6 @@ NODE_DISPLAY_NAME_MAPPINGS = {
     "SeedreamImageGenerateV2": "Seedream Image Generate V2",
     "SeedreamImageGenerateWithWebSearch": "Seedream Image Generate With Web Search",
     "SeedanceVideoGenerate": "Seedance Video Generate",
-    "TOSUploadVideoURL": "TOS Upload Video URL"
+    "TOSUploadVideoURL": "TOS Upload Video URL",
+    "TOSBatchUploadVideoURL": "TOS Batch Upload Video URL"
 }